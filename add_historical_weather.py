@@ -1,98 +1,70 @@
-import os
 import datetime
-import requests
 from dotenv import load_dotenv
-from app import app, db, WeatherLog
+from app import create_app, db, WeatherLog, weather_locations, fetch_historical_weather
+from open_meteo import describe
 
 load_dotenv()
+app = create_app()
 
-LAT = os.environ.get('FARM_LATITUDE', '26.1445')
-LON = os.environ.get('FARM_LONGITUDE', '91.7362')
-
-def get_historical_weather(date_str):
-    """Fetch historical weather data from Open-Meteo API"""
-    try:
-        url = "https://api.open-meteo.com/v1/forecast"
-        params = {
-            "latitude": LAT,
-            "longitude": LON,
-            "start_date": date_str,
-            "end_date": date_str,
-            "daily": ["weather_code", "temperature_2m_max", "precipitation_sum"],
-            "timezone": "auto"
-        }
-        
-        response = requests.get(url, params=params, timeout=10)
-        data = response.json()
-        
-        wmo_codes = {
-            0: "☀️ Clear Sky",
-            1: "🌤️ Mainly Clear", 2: "⛅ Partly Cloudy", 3: "☁️ Overcast",
-            45: "🌫️ Fog", 48: "🌫️ Rime Fog",
-            51: "DRIZZLE: Light", 53: "DRIZZLE: Moderate", 55: "DRIZZLE: Dense",
-            61: "Rain: Slight", 63: "RAINING: Moderate", 65: "RAINING: Heavy",
-            71: "SNOW: Slight", 73: "SNOW: Moderate", 75: "SNOW: Heavy",
-            80: "SHOWERS: Slight", 81: "SHOWERS: Moderate", 82: "SHOWERS: Violent",
-            95: "⚡ Thunderstorm", 96: "⚡ Thunderstorm + Hail", 99: "⚡ Thunderstorm + Heavy Hail"
-        }
-        
-        if response.status_code == 200 and 'daily' in data:
-            daily = data['daily']
-            code = daily['weather_code'][0]
-            desc = wmo_codes.get(code, f"Code: {code}")
-            
-            return {
-                'temp': daily['temperature_2m_max'][0],
-                'rainfall': daily['precipitation_sum'][0],
-                'desc': desc
-            }
-    except Exception as e:
-        print(f"Error fetching weather for {date_str}: {e}")
-    return None
-
-# Check for missing dates in the last 60 days
+# Check for missing dates in the last 60 days, for every weather location
 with app.app_context():
     print("Checking for missing weather data in the last 60 days...")
-    
+
     today = datetime.date.today()
     start_check_date = today - datetime.timedelta(days=60)
-    
-    # Get all existing dates
-    existing_logs = WeatherLog.query.filter(WeatherLog.date >= start_check_date).all()
-    existing_dates = {log.date for log in existing_logs}
-    
-    # Identify missing dates
-    missing_dates = []
-    current = start_check_date
-    while current < today:
-        if current not in existing_dates:
-            missing_dates.append(current)
-        current += datetime.timedelta(days=1)
-    
-    if not missing_dates:
+    end_check_date = today - datetime.timedelta(days=1)
+    locations = weather_locations()
+    default_id = locations[0]['id']
+
+    # Get all existing (location, date) pairs
+    existing = set(db.session.execute(
+        db.select(db.func.coalesce(WeatherLog.location_id, default_id), WeatherLog.date)
+        .where(WeatherLog.date >= start_check_date)
+    ).all())
+
+    # Identify missing dates per location
+    missing = {}
+    for location in locations:
+        current = start_check_date
+        while current < today:
+            if (location['id'], current) not in existing:
+                missing.setdefault(location['id'], set()).add(current)
+            current += datetime.timedelta(days=1)
+
+    if not missing:
         print("[OK] No missing dates found in the last 60 days.")
     else:
-        print(f"Found {len(missing_dates)} missing days. Starting import...")
+        pending = [location for location in locations if location['id'] in missing]
+        names = {location['id']: location['name'] for location in pending}
+        print(f"Found {sum(len(days) for days in missing.values())} missing days across {len(pending)} location(s). Starting import...")
+        # The forecast API also serves the recent past; one request covers every location
+        history = fetch_historical_weather(start_check_date, end_check_date, pending,
+                                           url=app.config['OPEN_METEO_FORECAST_URL'])
         count = 0
-        for date in missing_dates:
-            try:
-                weather_data = get_historical_weather(date.strftime('%Y-%m-%d'))
-                if weather_data:
-                    new_log = WeatherLog(
+        for location_id, daily in history.items():
+            for i, d_str in enumerate(daily.get('time', [])):
+                try:
+                    date = datetime.date.fromisoformat(d_str)
+                    if date not in missing[location_id]:
+                        continue
+                    desc = describe(daily['weather_code'][i])
+                    db.session.add(WeatherLog(
+                        location_id=location_id,
                         date=date,
-                        max_temp=weather_data['temp'],
-                        rainfall=weather_data['rainfall'],
-                        description=weather_data['desc'],
+                        max_temp=daily['temperature_2m_max'][i],
+                        min_temp=(daily.get('temperature_2m_min') or [None] * (i + 1))[i],
+                        rainfall=daily['precipitation_sum'][i],
+                        description=desc,
                         created_at=datetime.datetime.now()
-                    )
-                    db.session.add(new_log)
-                    print(f"[ADDED] {date}: {weather_data['temp']}C, {weather_data['desc']}")
+                    ))
+                    missing[location_id].discard(date)
+                    print(f"[ADDED] {names[location_id]} {date}: {daily['temperature_2m_max'][i]}C, {desc}")
                     count += 1
-                else:
-                    print(f"[FAIL] Could not fetch data for {date}")
-            except Exception as e:
-                print(f"[ERROR] {date}: {e}")
-        
+                except Exception as e:
+                    print(f"[ERROR] {d_str}: {e}")
+        for location_id, days in missing.items():
+            for date in sorted(days):
+                print(f"[FAIL] Could not fetch data for {names[location_id]} {date}")
+
         db.session.commit()
         print(f"\n[DONE] Successfully added {count} missing weather records.")
-
@@ -2,6 +2,8 @@ import os
 import requests
 import datetime
 import base64
+import json
+import threading
 
 class FarmAI:
     def __init__(self):
@@ -9,28 +11,178 @@ class FarmAI:
         self.api_key = os.environ.get('GEMINI_API_KEY')
         # Using Gemini 1.5 Flash for speed and multimodal capabilities (Text + Images)
         self.api_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:generateContent"
+        # Streaming variant: returns partial candidates as Server-Sent Events (alt=sse)
+        self.stream_url = "https://generativelanguage.googleapis.com/v1beta/models/gemini-1.5-flash:streamGenerateContent"
 
-    def _call_gemini(self, payload):
+        # Usage limits (0 = unlimited); see configure()
+        self.daily_token_budget = 0
+        self.daily_request_budget = 0
+        self.queue_timeout = 5
+        self._slots = threading.BoundedSemaphore(4)
+        # Hooks set by the app: recorder(call_stats) stores one call,
+        # usage_provider() returns (requests_today, tokens_today)
+        self.recorder = None
+        self.usage_provider = None
+
+    def configure(self, settings):
+        """Applies GEMINI_* endpoints and AI_* limits from the Flask config (or any dict)."""
+        # Re-read the key: .env may have been loaded after this module was imported
+        self.api_key = settings.get('GEMINI_API_KEY') or os.environ.get('GEMINI_API_KEY')
+        self.daily_token_budget = settings.get('AI_DAILY_TOKEN_BUDGET', 0)
+        self.daily_request_budget = settings.get('AI_DAILY_REQUEST_BUDGET', 0)
+        self.queue_timeout = settings.get('AI_QUEUE_TIMEOUT', 5)
+        if settings.get('GEMINI_API_BASE'):
+            model_url = f"{settings['GEMINI_API_BASE'].rstrip('/')}/models/{settings.get('GEMINI_MODEL', 'gemini-1.5-flash')}"
+            self.api_url = f"{model_url}:generateContent"
+            self.stream_url = f"{model_url}:streamGenerateContent"
+        self._slots = threading.BoundedSemaphore(settings.get('AI_MAX_CONCURRENT_CALLS', 4))
+
+    def _over_budget(self):
+        """Returns a user-facing message if today's budget is used up, else None."""
+        if not (self.daily_token_budget or self.daily_request_budget) or not self.usage_provider:
+            return None
+        try:
+            requests_today, tokens_today = self.usage_provider()
+        except Exception as e:
+            print(f"AI usage check failed: {e}")
+            return None
+        if self.daily_request_budget and requests_today >= self.daily_request_budget:
+            return "Daily AI request limit reached. Please try again tomorrow."
+        if self.daily_token_budget and tokens_today >= self.daily_token_budget:
+            return "Daily AI usage limit reached. Please try again tomorrow."
+        return None
+
+    def _record(self, method, started, payload, status, content="", usage=None, error=None, first_token_ms=None):
+        if not self.recorder:
+            return
+        usage = usage or {}
+        try:
+            self.recorder({
+                'method': method,
+                'status': status,
+                'started_at': started,
+                'latency_ms': (datetime.datetime.now() - started).total_seconds() * 1000,
+                'first_token_ms': first_token_ms,
+                'prompt_bytes': len(json.dumps(payload)),
+                'response_chars': len(content),
+                'prompt_tokens': usage.get('promptTokenCount'),
+                'response_tokens': usage.get('candidatesTokenCount'),
+                'total_tokens': usage.get('totalTokenCount'),
+                'error': error[:200] if error else None
+            })
+        except Exception as e:
+            print(f"AI call recording failed: {e}")
+
+    def _admit(self, method, payload):
+        """
+        Budget and concurrency gate. Returns an error result when the call
+        must be shed; otherwise holds a slot that the caller must release.
+        """
+        started = datetime.datetime.now()
+        message = self._over_budget()
+        if not message and not self._slots.acquire(timeout=self.queue_timeout):
+            message = "AI is busy right now. Please try again in a moment."
+        if message:
+            self._record(method, started, payload, 'shed', error=message)
+            return {"status": "error", "message": message}
+        return None
+
+    def _call_gemini(self, payload, method='generate'):
         if not self.api_key:
             return {"status": "error", "message": "AI API Key missing. Set GEMINI_API_KEY in .env"}
-            
+
+        refused = self._admit(method, payload)
+        if refused:
+            return refused
+
+        started = datetime.datetime.now()
+        result = {"status": "error", "message": "AI returned no content"}
+        usage = None
         try:
             headers = {'Content-Type': 'application/json'}
             params = {'key': self.api_key}
             
-            response = requests.post(self.api_url, json=payload, headers=headers, params=params)
+            response = requests.post(self.api_url, json=payload, headers=headers, params=params, timeout=60)
             data = response.json()
+            usage = data.get('usageMetadata')
             
             if 'error' in data:
-                return {"status": "error", "message": data['error'].get('message', 'Unknown AI Error')}
-                
-            if 'candidates' in data:
+                result = {"status": "error", "message": data['error'].get('message', 'Unknown AI Error')}
+            elif 'candidates' in data:
                 content = data['candidates'][0]['content']['parts'][0]['text']
-                return {"status": "success", "content": content}
-            
-            return {"status": "error", "message": "AI returned no content"}
+                result = {"status": "success", "content": content}
         except Exception as e:
-            return {"status": "error", "message": str(e)}
+            result = {"status": "error", "message": str(e)}
+        finally:
+            self._slots.release()
+
+        self._record(method, started, payload, result['status'], content=result.get('content', ''),
+                     usage=usage, error=result.get('message'))
+        return result
+
+    def _stream_gemini(self, payload, method='stream'):
+        """
+        Yields partial text as Gemini generates it.
+        Each item is {"status": "chunk", "content": ...}; the stream ends with
+        {"status": "done"} or a single {"status": "error", "message": ...}.
+        """
+        if not self.api_key:
+            yield {"status": "error", "message": "AI API Key missing. Set GEMINI_API_KEY in .env"}
+            return
+
+        refused = self._admit(method, payload)
+        if refused:
+            yield refused
+            return
+
+        started = datetime.datetime.now()
+        first_token_ms = None
+        content = ""
+        usage = None
+        error = None
+        try:
+            headers = {'Content-Type': 'application/json'}
+            params = {'key': self.api_key, 'alt': 'sse'}
+
+            with requests.post(self.stream_url, json=payload, headers=headers, params=params,
+                               stream=True, timeout=60) as response:
+                if response.status_code != 200:
+                    # Errors come back as a plain JSON body, not as an event stream
+                    data = response.json()
+                    error = data.get('error', {}).get('message', 'Unknown AI Error') if isinstance(data, dict) else 'Unknown AI Error'
+                else:
+                    # The event stream has no charset, so requests would fall back to ISO-8859-1
+                    response.encoding = 'utf-8'
+                    for line in response.iter_lines(decode_unicode=True):
+                        if not line or not line.startswith('data:'):
+                            continue
+                        data = json.loads(line[len('data:'):].strip())
+                        # Every chunk carries cumulative usage; the last one is the total
+                        usage = data.get('usageMetadata', usage)
+
+                        if 'error' in data:
+                            error = data['error'].get('message', 'Unknown AI Error')
+                            break
+
+                        for candidate in data.get('candidates', []):
+                            for part in candidate.get('content', {}).get('parts', []):
+                                if part.get('text'):
+                                    if first_token_ms is None:
+                                        first_token_ms = (datetime.datetime.now() - started).total_seconds() * 1000
+                                    content += part['text']
+                                    yield {"status": "chunk", "content": part['text']}
+
+                    if not error and not content:
+                        error = "AI returned no content"
+        except Exception as e:
+            error = str(e)
+        finally:
+            # Also runs when the browser disconnects mid-stream (GeneratorExit)
+            self._slots.release()
+            self._record(method, started, payload, 'error' if error else 'success', content=content,
+                         usage=usage, error=error, first_token_ms=first_token_ms)
+
+        yield {"status": "error", "message": error} if error else {"status": "done"}
 
     def analyze_logs(self, logs):
         """
@@ -50,12 +202,9 @@ class FarmAI:
         Keep the response concise and formatted in HTML (using <ul>, <li>, <strong> tags).
         """
         payload = {"contents": [{"parts": [{"text": prompt}]}]}
-        return self._call_gemini(payload)
+        return self._call_gemini(payload, method='analyze_logs')
 
-    def ask_crop_doctor(self, crop_name, sowing_date=None):
-        """
-        Provides Advice for a specific Crop.
-        """
+    def _crop_doctor_payload(self, crop_name, sowing_date=None):
         context = f"Planted on {sowing_date}" if sowing_date else "Planning to plant"
         prompt = f"""
         You are an expert Agronomist. The farmer is asking about '{crop_name}' ({context}).
@@ -66,8 +215,19 @@ class FarmAI:
         
         Keep it brief and practical. Use bullet points.
         """
-        payload = {"contents": [{"parts": [{"text": prompt}]}]}
-        return self._call_gemini(payload)
+        return {"contents": [{"parts": [{"text": prompt}]}]}
+
+    def ask_crop_doctor(self, crop_name, sowing_date=None):
+        """
+        Provides Advice for a specific Crop.
+        """
+        return self._call_gemini(self._crop_doctor_payload(crop_name, sowing_date), method='ask_crop_doctor')
+
+    def stream_crop_doctor(self, crop_name, sowing_date=None):
+        """
+        Streaming version of ask_crop_doctor (yields partial HTML chunks).
+        """
+        return self._stream_gemini(self._crop_doctor_payload(crop_name, sowing_date), method='stream_crop_doctor')
 
     def diagnose_from_image(self, image_bytes, mime_type="image/jpeg"):
         """
@@ -99,12 +259,9 @@ class FarmAI:
                 ]
             }]
         }
-        return self._call_gemini(payload)
+        return self._call_gemini(payload, method='diagnose_from_image')
 
-    def recommend_crops(self, area, season, location="India"):
-        """
-        Suggests profitable crops based on season and area.
-        """
+    def _recommend_crops_payload(self, area, season, location="India"):
         prompt = f"""
         Act as an Agriculture Business Consultant.
         The user has {area} of land available in {season} (Location: {location}).
@@ -117,8 +274,19 @@ class FarmAI:
         
         Format the response as a clean HTML table or list.
         """
-        payload = {"contents": [{"parts": [{"text": prompt}]}]}
-        return self._call_gemini(payload)
+        return {"contents": [{"parts": [{"text": prompt}]}]}
+
+    def recommend_crops(self, area, season, location="India"):
+        """
+        Suggests profitable crops based on season and area.
+        """
+        return self._call_gemini(self._recommend_crops_payload(area, season, location), method='recommend_crops')
+
+    def stream_recommend_crops(self, area, season, location="India"):
+        """
+        Streaming version of recommend_crops (yields partial HTML chunks).
+        """
+        return self._stream_gemini(self._recommend_crops_payload(area, season, location), method='stream_recommend_crops')
 
     def get_crop_duration(self, crop_name):
         """
@@ -130,7 +298,7 @@ class FarmAI:
         If it varies, give a safe average.
         """
         payload = {"contents": [{"parts": [{"text": prompt}]}]}
-        result = self._call_gemini(payload)
+        result = self._call_gemini(payload, method='get_crop_duration')
         
         if result['status'] == 'success':
             import re
@@ -139,5 +307,48 @@ class FarmAI:
                 return int(match.group())
         return None
 
+    def get_crop_durations(self, crop_names):
+        """
+        Returns {crop_name: days} for many crops using a single AI call.
+        Names the AI could not answer are left out.
+        """
+        if not crop_names:
+            return {}
+
+        names_text = "\n".join([f"- {name}" for name in crop_names])
+        prompt = f"""
+        For each crop below, how many days does it typically take from sowing to harvest?
+        {names_text}
+        
+        Return ONLY a VALID JSON object mapping each crop name exactly as written above to an integer number of days,
+        e.g. {{"rice": 120, "okra": 90}}. If it varies, give a safe average. Do NOT wrap in markdown code blocks.
+        """
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        result = self._call_gemini(payload, method='get_crop_durations')
+        
+        durations = {}
+        if result['status'] == 'success':
+            content = result['content']
+            # Strip markdown code blocks if present
+            if "```" in content:
+                content = content.split("```")[1]
+                if content.startswith("json"):
+                    content = content[len("json"):]
+            try:
+                data = json.loads(content.strip())
+            except ValueError:
+                return durations
+            if not isinstance(data, dict):
+                return durations
+            
+            for name, days in data.items():
+                try:
+                    days = int(days)
+                except (TypeError, ValueError):
+                    continue
+                if days > 0:
+                    durations[name] = days
+        return durations
+
 # Singleton instance
 ai_advisor = FarmAI()
@@ -1,85 +1,428 @@
 import os
-import shutil
+import argparse
 import datetime
 import json
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
 from pathlib import Path
 from dotenv import load_dotenv
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 load_dotenv()
 
-def backup_to_multiple_locations():
-    """Create backups in multiple locations for safety"""
-    db_path = Path('instance/farm_data.db')
-    
-    if not db_path.exists():
-        print("⚠️ No database file found to backup")
+from config import Config
+from backup_store import BackupStore, BackupCatalog, new_snapshot_id
+
+BACKUP_DIR = Path('backups')
+JOB_STATE_FILE = BACKUP_DIR / 'backup_job.json'
+JOB_LOCK_FILE = BACKUP_DIR / 'backup_job.lock'
+CATALOG_FILE = BACKUP_DIR / 'catalog.db'
+backup_catalog = BackupCatalog(CATALOG_FILE)
+
+class BackupLock:
+    """
+    Inter-process lock held for a whole backup, so two workers (or a worker
+    and the CLI) never snapshot, write chunks or collect garbage at once.
+    The OS drops it if the holding process dies.
+    """
+    def __init__(self, path=JOB_LOCK_FILE):
+        self.path = Path(path)
+        self.file = None
+
+    def acquire(self):
+        """Takes the lock without waiting. Returns False if another backup holds it."""
+        self.path.parent.mkdir(exist_ok=True)
+        handle = open(self.path, 'a+')
+        try:
+            if fcntl:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                handle.seek(0)
+                msvcrt.locking(handle.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            handle.close()
+            return False
+        self.file = handle
+        return True
+
+    def release(self):
+        if self.file is None:
+            return
+        if fcntl:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+
+def database_target(uri=None):
+    """Returns ('sqlite', Path) or ('postgresql', url) for the configured database."""
+    uri = uri or Config.SQLALCHEMY_DATABASE_URI
+    if uri.startswith('sqlite:///'):
+        return 'sqlite', Path(uri[len('sqlite:///'):])
+    if uri.startswith('postgresql'):
+        return 'postgresql', uri
+    return None, uri
+
+def snapshot_sqlite(db_path, dest, progress=None):
+    """
+    Consistent copy of a live SQLite database with VACUUM INTO. The copy
+    runs inside one read transaction, so (in WAL mode) writers carry on and
+    a steady stream of writes can't make it start over, as the online backup
+    API does. The copy is also compacted.
+    """
+    src = sqlite3.connect(f"file:{Path(db_path).resolve().as_posix()}?mode=ro", uri=True)
+    try:
+        expected = src.execute("PRAGMA page_count").fetchone()[0] * src.execute("PRAGMA page_size").fetchone()[0]
+        if progress and expected:
+            # No progress callback for VACUUM; estimate from how much of the copy is on disk
+            def on_progress():
+                try:
+                    progress(min(os.path.getsize(dest) / expected, 0.99))
+                except OSError:
+                    pass
+                return 0
+            src.set_progress_handler(on_progress, 100000)
+        src.execute("VACUUM INTO ?", (str(dest),))
+        if progress:
+            progress(1.0)
+    finally:
+        src.close()
+
+def snapshot_postgres(database_url, dest):
+    """Dumps a PostgreSQL database with pg_dump (custom format, restore with pg_restore)."""
+    result = subprocess.run(
+        ['pg_dump', '--format=custom', '--no-owner', '--file', str(dest), f'--dbname={database_url}'],
+        capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip() or 'pg_dump failed')
+
+def backup_to_multiple_locations(progress=None, log=print, uri=None):
+    """
+    Snapshot the database into the local chunk store and mirror the new
+    chunks to OneDrive/Desktop. Only changed chunks are written anywhere.
+    """
+    progress = progress or (lambda fraction: None)
+    kind, source = database_target(uri)
+
+    if kind == 'sqlite' and not source.exists():
+        log("⚠️ No database file found to backup")
+        return False
+    if kind is None:
+        log(f"⚠️ Unsupported database for backup: {source}")
         return False
-    
-    timestamp = datetime.datetime.now().strftime('%Y%m%d_%H%M%S')
+
+    started = time.time()
+    # Microsecond ids: two backups in the same second must not share a manifest
+    timestamp = new_snapshot_id()
     date_folder = datetime.datetime.now().strftime('%Y-%m-%d')
-    
-    # Backup Location 1: Local backups folder
-    backup_dir = Path('backups')
-    backup_dir.mkdir(exist_ok=True)
-    local_backup = backup_dir / f'farm_data_{timestamp}.db'
-    shutil.copy2(db_path, local_backup)
-    print(f"✅ Local backup: {local_backup}")
-    
-    # Backup Location 2: OneDrive (if available)
-    onedrive_base = Path(os.environ.get('USERPROFILE', '')) / 'OneDrive'
-    onedrive_path = onedrive_base / 'FarmApp_Backups' / date_folder
+
+    # 1. Consistent snapshot of the live database into a temporary file
+    BACKUP_DIR.mkdir(exist_ok=True)
+    snapshot_file = BACKUP_DIR / f'snapshot_{timestamp}.tmp'
+    if kind == 'sqlite':
+        snapshot_sqlite(source, snapshot_file, progress=lambda fraction: progress(fraction * 0.6))
+        method = 'sqlite_vacuum_into'
+    else:
+        snapshot_postgres(source, snapshot_file)
+        method = 'pg_dump'
+    progress(0.6)
+
+    # 2. Backup Location 1: Local chunk store (compressed, deduplicated)
+    local_store = BackupStore(BACKUP_DIR)
+    catalog = backup_catalog
+    if not CATALOG_FILE.exists():
+        catalog.rebuild(local_store)  # index the snapshots already on disk before adding this one
+    try:
+        manifest = local_store.add_snapshot(snapshot_file, timestamp, extra={'date': date_folder, 'method': method})
+    finally:
+        snapshot_file.unlink()
+    log(f"✅ Local backup: {manifest['snapshot']['new_chunks']} new of {len(manifest['snapshot']['chunks'])} chunks "
+        f"({manifest['snapshot']['stored_kb']:.2f} KB written)")
+    progress(0.75)
+
+    # Backup Location 2: OneDrive (if available); Location 3: Desktop (always accessible)
+    user_home = Path(os.environ.get('USERPROFILE', ''))
+    onedrive_base = user_home / 'OneDrive'
+    mirrors = {'desktop': BackupStore(user_home / 'Desktop' / 'FarmApp_Emergency_Backups')}
     if onedrive_base.exists():
+        mirrors['onedrive'] = BackupStore(onedrive_base / 'FarmApp_Backups')
+
+    manifest['duration_seconds'] = round(time.time() - started, 3)
+    manifest['backups'] = {
+        'local': str(BACKUP_DIR),
+        'desktop': str(mirrors['desktop'].root),
+        'onedrive': str(mirrors['onedrive'].root) if 'onedrive' in mirrors else None
+    }
+    local_store.write_manifest(manifest, replace=True)
+
+    # Index the snapshot (with a restore check) so status requests never scan the disk
+    verify_error = local_store.verify(timestamp)
+    catalog.record(manifest, verify_error=verify_error)
+    log(f"✅ Verified snapshot {timestamp}" if not verify_error else f"❌ Snapshot {timestamp} failed verification: {verify_error}")
+
+    for name, mirror in mirrors.items():
+        try:
+            local_store.mirror_to(mirror, manifest)
+            mirror.prune()
+            log(f"✅ {name.capitalize()} backup: {mirror.root}")
+        except Exception as e:
+            log(f"⚠️ {name.capitalize()} backup failed: {e}")
+    progress(0.9)
+
+    # Grandfather-father-son retention for the local store
+    removed = local_store.prune()
+    catalog.remove(removed)
+    if removed:
+        log(f"🗑️ Pruned {len(removed)} old snapshots")
+
+    # Full-copy backups from before the chunk store: keep only the last 10
+    legacy = sorted(BACKUP_DIR.glob('farm_data_*'), key=lambda x: x.stat().st_mtime, reverse=True)
+    for old_backup in legacy[10:]:
+        old_backup.unlink()
+        log(f"🗑️ Removed old backup: {old_backup.name}")
+
+    log(f"\n📋 Backup manifest: {BACKUP_DIR / f'manifest_{timestamp}.json'}")
+    log(f"💾 Total size: {manifest['database_size_kb']:.2f} KB")
+    progress(1.0)
+    return verify_error is None
+
+class BackupJob:
+    """
+    Runs backup_to_multiple_locations on a background thread.
+    State is mirrored to backups/backup_job.json so every gunicorn worker
+    reports the same progress; backups/backup_job.lock keeps it to one
+    backup at a time across workers.
+    """
+    def __init__(self, state_file=JOB_STATE_FILE):
+        self.state_file = Path(state_file)
+        self.lock_file = self.state_file.with_suffix('.lock')
+        self.lock = threading.Lock()
+        self.state = {'status': 'idle'}
+
+    def status(self):
+        try:
+            with open(self.state_file, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return dict(self.state)
+
+    def _update(self, **changes):
+        with self.lock:
+            self.state.update(changes, updated_at=datetime.datetime.now().isoformat())
+            self.state_file.parent.mkdir(exist_ok=True)
+            tmp = self.state_file.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(self.state, f)
+            os.replace(tmp, self.state_file)
+
+    def last_finished(self):
+        """Datetime the last successful backup finished (any worker), or None."""
+        state = self.status()
+        if state.get('status') == 'success' and state.get('finished_at'):
+            return datetime.datetime.fromisoformat(state['finished_at'])
+        return None
+
+    def is_running(self):
+        """True while a backup holds the lock, in this process or any other."""
+        probe = BackupLock(self.lock_file)
+        if not probe.acquire():
+            return True
+        probe.release()
+        return False
+
+    def start(self, uri=None):
+        """Starts a backup unless one is already running (in any process). Returns True if started."""
+        # The state file is for progress; the lock file is what keeps backups one at a time
+        job_lock = BackupLock(self.lock_file)
+        if not job_lock.acquire():
+            return False
+        try:
+            with self.lock:
+                self.state = {'status': 'running', 'progress': 0.0, 'log': [],
+                              'started_at': datetime.datetime.now().isoformat()}
+            self._update()
+            threading.Thread(target=self._run, args=(uri, job_lock), daemon=True).start()
+        except Exception:
+            job_lock.release()
+            raise
+        return True
+
+    def _run(self, uri, job_lock):
+        log_lines = []
+        last_write = [0.0]
+
+        def log(line):
+            log_lines.append(line)
+            self._update(log=list(log_lines))
+
+        def progress(fraction):
+            # Throttle file writes during the paged copy
+            if fraction >= 1.0 or time.time() - last_write[0] > 0.5:
+                last_write[0] = time.time()
+                self._update(progress=round(fraction, 3))
+
         try:
-            onedrive_path.mkdir(parents=True, exist_ok=True)
-            onedrive_backup = onedrive_path / f'farm_data_{timestamp}.db'
-            shutil.copy2(db_path, onedrive_backup)
-            print(f"✅ OneDrive backup: {onedrive_backup}")
+            ok = backup_to_multiple_locations(progress=progress, log=log, uri=uri)
+            self._update(status='success' if ok else 'error', progress=1.0 if ok else self.state.get('progress', 0),
+                         finished_at=datetime.datetime.now().isoformat())
         except Exception as e:
-            print(f"⚠️ OneDrive backup failed: {e}")
+            log(f"❌ {e}")
+            self._update(status='error', finished_at=datetime.datetime.now().isoformat())
+        finally:
+            job_lock.release()
+
+# Singleton used by the web app
+backup_job = BackupJob()
+
+class AutoBackup:
+    """
+    Debounced backup trigger for database writes.
+    notify_write() runs on every commit, so it only notes the time under a
+    lock; one long-lived thread per process does the waiting. A burst of
+    writes produces one backup once things go quiet for `quiet_seconds`,
+    but never later than `max_wait_seconds` after the first unsaved write,
+    and never sooner than `min_interval_seconds` after the previous backup.
+    """
+    RETRY_SECONDS = 5  # wait before retrying while another worker is backing up
+
+    def __init__(self, job):
+        self.job = job
+        self.enabled = False
+        self.uri = None
+        self.quiet_seconds = 60
+        self.max_wait_seconds = 900
+        self.min_interval_seconds = 900
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.first_write = None  # monotonic time of the first write not yet backed up
+        self.last_write = None
+        self.thread_pid = None
+
+    def configure(self, settings):
+        self.enabled = settings.get('AUTO_BACKUP_ENABLED', False)
+        self.uri = settings.get('SQLALCHEMY_DATABASE_URI')
+        self.quiet_seconds = settings.get('AUTO_BACKUP_QUIET_SECONDS', 60)
+        self.max_wait_seconds = settings.get('AUTO_BACKUP_MAX_WAIT_SECONDS', 900)
+        self.min_interval_seconds = settings.get('AUTO_BACKUP_MIN_INTERVAL_SECONDS', 900)
+
+    def notify_write(self):
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self.lock:
+            self.last_write = now
+            if self.first_write is not None:
+                return
+            self.first_write = now
+            # Started here rather than at import, so each forked worker gets its own
+            if self.thread_pid != os.getpid():
+                self.thread_pid = os.getpid()
+                threading.Thread(target=self._loop, daemon=True).start()
+        self.wake.set()
+
+    def _seconds_until_due(self):
+        with self.lock:
+            if self.first_write is None:
+                return None
+            due = min(self.last_write + self.quiet_seconds, self.first_write + self.max_wait_seconds)
+        wait = due - time.monotonic()
+        # Off the request path, so reading the shared job state here is fine
+        last = self.job.last_finished()
+        if last:
+            wait = max(wait, last.timestamp() + self.min_interval_seconds - time.time())
+        return wait
+
+    def _loop(self):
+        while True:
+            wait = self._seconds_until_due()
+            if wait is None:
+                self.wake.wait()
+                self.wake.clear()
+                continue
+            if wait > 0:
+                # Re-checked on waking: later writes push the quiet deadline back
+                time.sleep(wait)
+                continue
+            with self.lock:
+                pending = (self.first_write, self.last_write)
+                self.first_write = self.last_write = None
+            try:
+                started = self.job.start(self.uri)
+            except Exception as e:
+                print(f"Auto-backup failed to start: {e}")
+                continue
+            if not started:
+                # Another worker is backing up right now; try again after it settles
+                with self.lock:
+                    if self.first_write is None:
+                        self.first_write, self.last_write = pending
+                time.sleep(self.RETRY_SECONDS)
+
+auto_backup = AutoBackup(backup_job)
+
+def run_cli():
+    parser = argparse.ArgumentParser(description="Farm database backups")
+    sub = parser.add_subparsers(dest='command')
+    sub.add_parser('list', help='List restorable snapshots')
+    sub.add_parser('reindex', help='Rebuild the catalog from the manifests on disk')
+    verify_cmd = sub.add_parser('verify', help='Check snapshots can be restored')
+    verify_cmd.add_argument('timestamp', nargs='?', help='Snapshot to check (default: all)')
+    restore_cmd = sub.add_parser('restore', help='Rebuild a snapshot into a database file')
+    restore_cmd.add_argument('timestamp')
+    restore_cmd.add_argument('dest', help='Output file, e.g. instance/restored.db')
+    args = parser.parse_args()
+
+    store = BackupStore(BACKUP_DIR)
+    catalog = backup_catalog
+    if args.command == 'list':
+        for entry in catalog.list(limit=1000):
+            print(f"{entry['timestamp']}  {entry['size_kb']:>10.2f} KB  {entry['stored_kb']:>8.2f} KB stored  "
+                  f"{'✅ verified' if entry['verified'] else '❌ ' + (entry['verify_error'] or 'unverified')}")
+    elif args.command == 'reindex':
+        catalog.rebuild(store)
+        print(f"✅ Catalog rebuilt: {len(catalog.list(limit=100000))} snapshots")
+    elif args.command == 'verify':
+        timestamps = [args.timestamp] if args.timestamp else [m['timestamp'] for m in store.manifests()]
+        failures = 0
+        for timestamp in timestamps:
+            error = store.verify(timestamp)
+            catalog.mark_verified(timestamp, error)
+            print(f"{'✅' if not error else '❌'} {timestamp} {error or ''}")
+            failures += bool(error)
+        return failures == 0
+    elif args.command == 'restore':
+        store.restore(args.timestamp, args.dest)
+        print(f"✅ Restored {args.timestamp} to {args.dest}")
     else:
-        onedrive_backup = None
-    
-    # Backup Location 3: Desktop dated folder (always accessible)
-    desktop_backup_dir = Path(os.environ.get('USERPROFILE', '')) / 'Desktop' / 'FarmApp_Emergency_Backups' / date_folder
-    desktop_backup_dir.mkdir(parents=True, exist_ok=True)
-    desktop_backup = desktop_backup_dir / f'farm_data_{timestamp}.db'
-    shutil.copy2(db_path, desktop_backup)
-    print(f"✅ Desktop backup: {desktop_backup}")
-    
-    # Keep only last 10 backups in local folder
-    backups = sorted(backup_dir.glob('farm_data_*.db'), key=lambda x: x.stat().st_mtime, reverse=True)
-    if len(backups) > 10:
-        for old_backup in backups[10:]:
-            old_backup.unlink()
-            print(f"🗑️ Removed old backup: {old_backup.name}")
-    
-    # Create a backup manifest
-    manifest = {
-        'timestamp': timestamp,
-        'date': date_folder,
-        'database_size_kb': db_path.stat().st_size / 1024,
-        'backups': {
-            'local': str(local_backup),
-            'desktop': str(desktop_backup),
-            'onedrive': str(onedrive_backup) if onedrive_path.exists() else None
-        }
-    }
-    
-    manifest_file = backup_dir / f'manifest_{timestamp}.json'
-    with open(manifest_file, 'w') as f:
-        json.dump(manifest, f, indent=2)
-    
-    print(f"\n📋 Backup manifest: {manifest_file}")
-    print(f"💾 Total size: {manifest['database_size_kb']:.2f} KB")
+        print("=" * 60)
+        print("🔒 MULTI-LOCATION DATABASE BACKUP SYSTEM")
+        print("=" * 60)
+        job_lock = BackupLock()
+        if not job_lock.acquire():
+            print("\n⚠️ Another backup is running; try again when it finishes")
+            return False
+        try:
+            success = backup_to_multiple_locations()
+        finally:
+            job_lock.release()
+        if success:
+            print("\n✅ ALL BACKUPS COMPLETED SUCCESSFULLY!")
+            print("Your data is now safe in 3 locations.")
+        else:
+            print("\n❌ BACKUP FAILED - Check database location")
+        return success
     return True
 
 if __name__ == '__main__':
-    print("=" * 60)
-    print("🔒 MULTI-LOCATION DATABASE BACKUP SYSTEM")
-    print("=" * 60)
-    success = backup_to_multiple_locations()
-    if success:
-        print("\n✅ ALL BACKUPS COMPLETED SUCCESSFULLY!")
-        print("Your data is now safe in 3 locations.")
-    else:
-        print("\n❌ BACKUP FAILED - Check database location")
+    sys.exit(0 if run_cli() else 1)
@@ -0,0 +1,339 @@
+"""
+Content-addressed, compressed backup store.
+
+A snapshot file is split into fixed-size chunks (a multiple of the SQLite
+page size, so an edited page only changes its own chunk). Each chunk is
+stored once, zlib-compressed, under chunks/<sha[:2]>/<sha>. A snapshot is
+just a manifest_<timestamp>.json listing its chunk hashes, so an hourly
+backup of a mostly unchanged database only writes a few kilobytes.
+
+Snapshot ids ("timestamps") are local time down to the microsecond,
+e.g. 20250101_120000_123456; older ones stop at the second. They sort in
+time order either way, and a manifest or catalog row is never overwritten
+by a different snapshot.
+"""
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import zlib
+from pathlib import Path
+
+CHUNK_SIZE = 64 * 1024
+
+# Grandfather-father-son retention: (window, bucket) pairs. Inside each
+# window the newest snapshot of every bucket is kept (None = keep all).
+RETENTION_TIERS = [
+    (datetime.timedelta(hours=1), None),          # everything from the last hour
+    (datetime.timedelta(hours=24), '%Y%m%d%H'),   # hourly for a day
+    (datetime.timedelta(days=7), '%Y%m%d'),       # daily for a week
+    (datetime.timedelta(weeks=5), '%G%V'),        # weekly for a month
+    (datetime.timedelta(days=366), '%Y%m'),       # monthly for a year
+]
+
+def new_snapshot_id(now=None):
+    return (now or datetime.datetime.now()).strftime('%Y%m%d_%H%M%S_%f')
+
+def snapshot_time(timestamp):
+    """When a snapshot was taken, from its id (with or without microseconds)."""
+    if timestamp.count('_') == 2:
+        return datetime.datetime.strptime(timestamp, '%Y%m%d_%H%M%S_%f')
+    return datetime.datetime.strptime(timestamp, '%Y%m%d_%H%M%S')
+
+class BackupStore:
+    def __init__(self, root):
+        self.root = Path(root)
+        self.chunk_dir = self.root / 'chunks'
+
+    # --- chunks ---
+    def _chunk_path(self, digest):
+        return self.chunk_dir / digest[:2] / digest
+
+    def _put_chunk(self, data):
+        """Stores one chunk if new. Returns (digest, compressed_bytes_written)."""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if path.exists():
+            return digest, 0
+        path.parent.mkdir(parents=True, exist_ok=True)
+        compressed = zlib.compress(data, 6)
+        tmp = path.with_suffix('.tmp')
+        with open(tmp, 'wb') as f:
+            f.write(compressed)
+        os.replace(tmp, path)
+        return digest, len(compressed)
+
+    def _read_chunk(self, digest):
+        with open(self._chunk_path(digest), 'rb') as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Chunk {digest[:12]} is corrupt")
+        return data
+
+    # --- snapshots ---
+    def add_snapshot(self, file_path, timestamp, extra=None):
+        """Chunks file_path into the store and writes manifest_<timestamp>.json (which must be new)."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        if (self.root / f"manifest_{timestamp}.json").exists():
+            raise FileExistsError(f"Snapshot {timestamp} already exists")
+        whole = hashlib.sha256()
+        chunks = []
+        new_chunks = 0
+        stored_bytes = 0
+        size = 0
+        with open(file_path, 'rb') as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                whole.update(data)
+                digest, written = self._put_chunk(data)
+                chunks.append(digest)
+                if written:
+                    new_chunks += 1
+                    stored_bytes += written
+
+        manifest = dict(extra or {})
+        manifest.update({
+            'timestamp': timestamp,
+            'database_size_kb': size / 1024,
+            'snapshot': {
+                'size': size,
+                'sha256': whole.hexdigest(),
+                'chunk_size': CHUNK_SIZE,
+                'chunks': chunks,
+                'new_chunks': new_chunks,
+                'stored_kb': round(stored_bytes / 1024, 2)
+            }
+        })
+        self.write_manifest(manifest)
+        return manifest
+
+    def write_manifest(self, manifest, replace=False):
+        """
+        Writes manifest_<timestamp>.json atomically. Unless `replace` (an update
+        to the same snapshot), an existing manifest raises FileExistsError.
+        """
+        path = self.root / f"manifest_{manifest['timestamp']}.json"
+        tmp = path.with_suffix(f'.{os.getpid()}.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        if replace:
+            os.replace(tmp, path)
+            return
+        try:
+            os.link(tmp, path)  # fails if the name is taken, unlike a rename
+        except FileExistsError:
+            raise FileExistsError(f"Snapshot {manifest['timestamp']} already exists")
+        finally:
+            tmp.unlink()
+
+    def manifests(self):
+        """Chunked snapshots, newest first (legacy full-copy manifests are skipped)."""
+        found = []
+        for path in self.root.glob('manifest_*.json'):
+            try:
+                with open(path, 'r') as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if 'snapshot' in manifest:
+                found.append(manifest)
+        return sorted(found, key=lambda m: m['timestamp'], reverse=True)
+
+    def get_manifest(self, timestamp):
+        with open(self.root / f'manifest_{timestamp}.json', 'r') as f:
+            return json.load(f)
+
+    def restore(self, timestamp, dest):
+        """Rebuilds a snapshot into dest, verifying every chunk and the whole file."""
+        snapshot = self.get_manifest(timestamp)['snapshot']
+        whole = hashlib.sha256()
+        tmp = Path(str(dest) + '.restoring')
+        with open(tmp, 'wb') as out:
+            for digest in snapshot['chunks']:
+                data = self._read_chunk(digest)
+                whole.update(data)
+                out.write(data)
+        if whole.hexdigest() != snapshot['sha256']:
+            tmp.unlink()
+            raise ValueError(f"Snapshot {timestamp} failed checksum")
+        os.replace(tmp, dest)
+        return dest
+
+    def verify(self, timestamp):
+        """Returns None if the snapshot restores cleanly, else an error message."""
+        try:
+            snapshot = self.get_manifest(timestamp)['snapshot']
+            whole = hashlib.sha256()
+            for digest in snapshot['chunks']:
+                whole.update(self._read_chunk(digest))
+            if whole.hexdigest() != snapshot['sha256']:
+                return "checksum mismatch"
+        except Exception as e:
+            return str(e)
+        return None
+
+    def mirror_to(self, other, manifest):
+        """Copies one snapshot (only the chunks `other` lacks) into another store."""
+        for digest in manifest['snapshot']['chunks']:
+            target = other._chunk_path(digest)
+            if not target.exists():
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(self._chunk_path(digest), target)
+        # Same snapshot, so re-mirroring it may update the copy
+        other.write_manifest(manifest, replace=True)
+
+    # --- retention ---
+    def prune(self, now=None):
+        """Applies RETENTION_TIERS, then deletes chunks no snapshot uses. Returns removed timestamps."""
+        now = now or datetime.datetime.now()
+        keep = set()
+        manifests = self.manifests()
+        for window, bucket_format in RETENTION_TIERS:
+            seen_buckets = set()
+            for manifest in manifests:  # newest first
+                taken = snapshot_time(manifest['timestamp'])
+                if now - taken > window:
+                    continue
+                bucket = taken.strftime(bucket_format) if bucket_format else manifest['timestamp']
+                if bucket not in seen_buckets:
+                    seen_buckets.add(bucket)
+                    keep.add(manifest['timestamp'])
+        if manifests:
+            keep.add(manifests[0]['timestamp'])  # never drop the latest
+
+        removed = []
+        for manifest in manifests:
+            if manifest['timestamp'] not in keep:
+                (self.root / f"manifest_{manifest['timestamp']}.json").unlink()
+                removed.append(manifest['timestamp'])
+        if removed:
+            self.collect_garbage()
+        return removed
+
+    def collect_garbage(self):
+        """Deletes chunks not referenced by any remaining snapshot."""
+        live = set()
+        for manifest in self.manifests():
+            live.update(manifest['snapshot']['chunks'])
+        freed = 0
+        for path in self.chunk_dir.glob('*/*'):
+            if path.name not in live:
+                freed += path.stat().st_size
+                path.unlink()
+        return freed
+
+
+class BackupCatalog:
+    """
+    Index of snapshots kept in backups/catalog.db (separate from the farm
+    database, so restoring a snapshot never rewrites its own catalog).
+    Written at backup time, so status/list requests never scan the disk.
+    """
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def _connect(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(self.path), timeout=10)
+        conn.row_factory = sqlite3.Row
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS snapshot (
+                timestamp TEXT PRIMARY KEY,
+                taken_at TEXT NOT NULL,
+                method TEXT,
+                size_kb REAL,
+                stored_kb REAL,
+                chunk_count INTEGER,
+                sha256 TEXT,
+                duration_seconds REAL,
+                locations TEXT,
+                verified INTEGER,
+                verified_at TEXT,
+                verify_error TEXT
+            )
+        """)
+        return conn
+
+    def record(self, manifest, verify_error=None, replace=False):
+        """Adds a snapshot. Unless `replace` (re-indexing the same one), an existing row raises ValueError."""
+        snapshot = manifest['snapshot']
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute(
+                    f"INSERT {'OR REPLACE ' if replace else ''}INTO snapshot VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (manifest['timestamp'], snapshot_time(manifest['timestamp']).isoformat(),
+                     manifest.get('method'), manifest['database_size_kb'], snapshot['stored_kb'],
+                     len(snapshot['chunks']), snapshot['sha256'], manifest.get('duration_seconds'),
+                     json.dumps(manifest.get('backups', {})), 0 if verify_error else 1,
+                     datetime.datetime.now().isoformat(), verify_error)
+                )
+        except sqlite3.IntegrityError:
+            raise ValueError(f"Snapshot {manifest['timestamp']} is already in the catalog")
+        finally:
+            conn.close()
+
+    def mark_verified(self, timestamp, verify_error=None):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute("UPDATE snapshot SET verified = ?, verified_at = ?, verify_error = ? WHERE timestamp = ?",
+                             (0 if verify_error else 1, datetime.datetime.now().isoformat(), verify_error, timestamp))
+        finally:
+            conn.close()
+
+    def remove(self, timestamps):
+        if not timestamps:
+            return
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany("DELETE FROM snapshot WHERE timestamp = ?", [(t,) for t in timestamps])
+        finally:
+            conn.close()
+
+    def summary(self):
+        """Latest snapshot plus the total count, in one query."""
+        conn = self._connect()
+        try:
+            row = conn.execute("""
+                SELECT s.*, (SELECT COUNT(*) FROM snapshot) AS snapshot_count
+                FROM snapshot s ORDER BY s.timestamp DESC LIMIT 1
+            """).fetchone()
+        finally:
+            conn.close()
+        return self._as_dict(row) if row else None
+
+    def list(self, limit=50, offset=0):
+        conn = self._connect()
+        try:
+            rows = conn.execute("SELECT * FROM snapshot ORDER BY timestamp DESC LIMIT ? OFFSET ?",
+                                (limit, offset)).fetchall()
+        finally:
+            conn.close()
+        return [self._as_dict(row) for row in rows]
+
+    def get(self, timestamp):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT * FROM snapshot WHERE timestamp = ?", (timestamp,)).fetchone()
+        finally:
+            conn.close()
+        return self._as_dict(row) if row else None
+
+    def rebuild(self, store):
+        """Re-indexes every manifest in a store (for catalogs lost or created late)."""
+        for manifest in store.manifests():
+            self.record(manifest, verify_error=store.verify(manifest['timestamp']), replace=True)
+
+    @staticmethod
+    def _as_dict(row):
+        data = dict(row)
+        data['locations'] = json.loads(data['locations'] or '{}')
+        data['verified'] = bool(data['verified'])
+        return data
@@ -0,0 +1,143 @@
+"""
+Import and boot time of the app, in fresh processes.
+
+  import        `import app` alone (what every script and worker pays)
+  create_app    building the configured app
+  first request the first GET / on a new app (lazy loading lands here)
+  gunicorn      spawn -> first 200 and total PSS, with and without preload
+
+Usage:
+    python benchmarks/boot_time.py --runs 5 --workers 4
+"""
+import argparse
+import datetime
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / 'benchmarks' / 'results'
+
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app as farm_app
+imported = time.perf_counter()
+flask_app = farm_app.create_app()
+created = time.perf_counter()
+with flask_app.app_context():
+    farm_app.db.create_all()
+ready = time.perf_counter()
+flask_app.test_client().get('/knowledge')
+served = time.perf_counter()
+print(json.dumps({'import_ms': (imported - started) * 1000, 'create_app_ms': (created - imported) * 1000,
+                  'first_request_ms': (served - ready) * 1000}))
+"""
+
+
+def _env(workdir):
+    return dict(os.environ, APP_ENV='production', DATABASE_URL=f"sqlite:///{workdir / 'boot.db'}",
+                METRICS_DIR=str(workdir / 'metrics'), CACHE_DIR=str(workdir / 'cache'), AUTO_BACKUP_ENABLED='0')
+
+
+def measure_import(workdir, runs):
+    samples = []
+    for _ in range(runs):
+        output = subprocess.check_output([sys.executable, '-c', PROBE], cwd=str(ROOT), env=_env(workdir),
+                                         stderr=subprocess.DEVNULL, text=True)
+        samples.append(json.loads(output.strip().splitlines()[-1]))
+    return {key: round(statistics.median(s[key] for s in samples), 1) for key in samples[0]}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _children(pid):
+    pids = []
+    for task in Path(f'/proc/{pid}/task').glob('*/children'):
+        pids.extend(int(child) for child in task.read_text().split())
+    return pids
+
+
+def _pss_mb(pids):
+    """Proportional set size (shared pages split between processes); None off Linux."""
+    total_kb = 0
+    try:
+        for pid in pids:
+            for line in Path(f'/proc/{pid}/smaps_rollup').read_text().splitlines():
+                if line.startswith('Pss:'):
+                    total_kb += int(line.split()[1])
+    except OSError:
+        return None
+    return round(total_kb / 1024, 1)
+
+
+def measure_gunicorn(workdir, workers, preload):
+    import requests
+
+    port = _free_port()
+    command = [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+               '--log-level', 'warning', 'wsgi:app']
+    if preload:
+        command.insert(3, '--preload')
+    started = time.perf_counter()
+    server = subprocess.Popen(command, cwd=str(ROOT), env=_env(workdir),
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                if requests.get(f"http://127.0.0.1:{port}/knowledge", timeout=5).status_code == 200:
+                    break
+            except requests.RequestException:
+                if server.poll() is not None or time.perf_counter() - started > 60:
+                    raise RuntimeError("gunicorn did not start")
+                time.sleep(0.02)
+        first_response_ms = (time.perf_counter() - started) * 1000
+
+        # Wait until every worker exists, then let them settle
+        while len(_children(server.pid)) < workers and time.perf_counter() - started < 60:
+            time.sleep(0.05)
+        time.sleep(1)
+        return {'first_response_ms': round(first_response_ms, 1),
+                'pss_mb': _pss_mb([server.pid] + _children(server.pid))}
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Import and boot time of the app')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<time>_boot.json)')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix='farm_boot_') as tmp:
+        workdir = Path(tmp)
+        subprocess.check_call([sys.executable, '-m', 'flask', '--app', 'wsgi', 'init-db'], cwd=str(ROOT),
+                              env=_env(workdir), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        report = {'meta': {'runs': args.runs, 'workers': args.workers,
+                           'timestamp': datetime.datetime.now().isoformat(timespec='seconds')}}
+        report['process'] = measure_import(workdir, args.runs)
+        print(f"📦 import {report['process']['import_ms']}ms, create_app {report['process']['create_app_ms']}ms, "
+              f"first request {report['process']['first_request_ms']}ms (median of {args.runs})")
+        for preload in (False, True):
+            label = 'gunicorn_preload' if preload else 'gunicorn'
+            report[label] = measure_gunicorn(workdir, args.workers, preload)
+            print(f"🦄 {label}: first response {report[label]['first_response_ms']}ms, "
+                  f"{args.workers} workers use {report[label]['pss_mb']} MB PSS")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{datetime.datetime.now():%Y%m%d_%H%M%S}_boot.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results saved to {output}")
@@ -0,0 +1,315 @@
+"""
+End-to-end benchmark: every page and API route against a seeded synthetic
+database, with the upstream APIs replaced by stub_server.py.
+
+Two drivers:
+  client    - Flask test client in this process (no network, per-route
+              Python allocation peak via tracemalloc)
+  gunicorn  - real gunicorn workers over HTTP with concurrent clients
+              (peak RSS summed over master + workers)
+
+Each run reports p50/p95/p99 latency and queries per request for every
+route and writes the results as JSON, so two runs can be compared.
+
+Usage:
+    python benchmarks/run_benchmarks.py --rows 10000
+    python benchmarks/run_benchmarks.py --driver gunicorn --workers 4 --concurrency 8
+    python benchmarks/run_benchmarks.py --compare benchmarks/results/old.json benchmarks/results/new.json
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / 'benchmarks' / 'results'
+sys.path.insert(0, str(ROOT))
+
+from stub_server import start_stub_server
+from synthetic_data import populate
+
+# Routes that need arguments, a body, or that write. Plain GET routes are
+# discovered from the URL map. (name, method, path, request kwargs)
+EXTRA_SCENARIOS = [
+    ('edit_record', 'GET', '/edit_record/1', {}),
+    ('edit_crop', 'GET', '/edit_crop/1', {}),
+    ('api_ask_crop_doctor', 'POST', '/api/ask_crop_doctor', {'json': {'crop_name': 'Rice', 'sowing_date': '2025-06-15'}}),
+    ('api_recommend_crops', 'POST', '/api/recommend_crops', {'json': {'area': '2 Bigha', 'season': 'Rabi'}}),
+    ('api_stream_ask_crop_doctor', 'GET', '/api/stream/ask_crop_doctor?crop_name=Rice&sowing_date=2025-06-15', {}),
+    ('api_stream_recommend_crops', 'GET', '/api/stream/recommend_crops?area=2+Bigha&season=Rabi', {}),
+    ('api_estimate_durations', 'POST', '/api/estimate_durations', {'json': {'crop_names': ['Rice', 'Mustard', 'Potato']}}),
+    ('api_check_etl', 'POST', '/api/check-etl', {'json': {'crop': 'Rice', 'pest': 'Stem Borer', 'value': 3}}),
+    ('quick_note', 'POST', '/quick_note', {'data': {'content': 'benchmark note'}}),
+    ('add_record', 'POST', '/add_record', {'data': {'date': '2025-07-01', 'activity': 'Weeding', 'category': 'Expense',
+                                                   'expense_type': 'Labour', 'amount': '450', 'description': 'benchmark'}}),
+]
+
+# Discovered GET routes left out of the run
+SKIP_ROUTES = {'/static/<path:filename>'}
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def summarize(latencies, queries, errors):
+    if not latencies:
+        return {'requests': 0, 'errors': errors}
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 50), 2),
+        'p95_ms': round(percentile(latencies, 95), 2),
+        'p99_ms': round(percentile(latencies, 99), 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def scenarios(flask_app):
+    found = []
+    for rule in flask_app.url_map.iter_rules():
+        if 'GET' in rule.methods and not rule.arguments and rule.rule not in SKIP_ROUTES:
+            found.append((rule.endpoint, 'GET', rule.rule, {}))
+    found.sort(key=lambda s: s[2])
+    return found + EXTRA_SCENARIOS
+
+
+def prepare_environment(workdir, rows, seed, stub_latency_ms):
+    """Stub upstreams, a fresh database and env vars for the app. Returns (stub_server, env)."""
+    stub, stub_env = start_stub_server(latency_ms=stub_latency_ms, chunk_delay_ms=0, seed=seed)
+    env = dict(stub_env)
+    env.update({
+        'APP_ENV': 'production',
+        'DATABASE_URL': f"sqlite:///{workdir / 'bench.db'}",
+        'METRICS_DIR': str(workdir / 'metrics'),
+        'CACHE_DIR': str(workdir / 'cache'),
+        'AUTO_BACKUP_ENABLED': '0',
+        'QUERY_AUDIT': '1',
+    })
+    os.environ.update(env)
+
+    import app as farm_app
+    with farm_app.app.app_context():
+        farm_app.db.create_all()
+        print(f"🌱 Seeding {rows:,} rows (seed {seed})")
+        populate(farm_app.db, vars(farm_app), rows=rows, seed=seed)
+    return stub, env
+
+
+def run_client(iterations, warmup):
+    import app as farm_app
+    client = farm_app.app.test_client()
+    results = {}
+    for name, method, path, kwargs in scenarios(farm_app.app):
+        with contextlib.redirect_stdout(io.StringIO()):  # N+1 warnings from the query audit
+            results[name] = _measure_client(client, method, path, kwargs, iterations, warmup)
+        print(f"  {name:<32}p50 {results[name].get('p50_ms', '-'):>8} ms  p95 {results[name].get('p95_ms', '-'):>8} ms  "
+              f"queries {results[name].get('queries_per_request')}")
+
+    # ru_maxrss is KB on Linux, bytes on macOS
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = maxrss / 1024 / (1024 if sys.platform == 'darwin' else 1)
+    return results, {'peak_rss_mb': round(peak_rss_mb, 1)}
+
+
+def _measure_client(client, method, path, kwargs, iterations, warmup):
+    for _ in range(warmup):
+        client.open(path, method=method, **kwargs).get_data()
+
+    latencies, queries, errors = [], [], 0
+    for _ in range(iterations):
+        started = time.perf_counter()
+        response = client.open(path, method=method, **kwargs)
+        response.get_data()  # drain streamed bodies
+        latencies.append((time.perf_counter() - started) * 1000)
+        if response.status_code >= 400:
+            errors += 1
+        if 'X-Query-Count' in response.headers:
+            queries.append(int(response.headers['X-Query-Count']))
+
+    # One extra request under tracemalloc for the allocation peak
+    tracemalloc.start()
+    client.open(path, method=method, **kwargs).get_data()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = summarize(latencies, queries, errors)
+    result.update(method=method, path=path, peak_alloc_kb=round(peak / 1024, 1))
+    return result
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _process_tree(pid):
+    pids = [pid]
+    for task in Path(f'/proc/{pid}/task').glob('*/children'):
+        for child in task.read_text().split():
+            pids.extend(_process_tree(int(child)))
+    return pids
+
+
+def _peak_rss_mb(pid):
+    """Sum of VmHWM (peak RSS) over a process and its children; None off Linux."""
+    total_kb = 0
+    try:
+        for child in _process_tree(pid):
+            for line in Path(f'/proc/{child}/status').read_text().splitlines():
+                if line.startswith('VmHWM:'):
+                    total_kb += int(line.split()[1])
+    except OSError:
+        return None
+    return round(total_kb / 1024, 1)
+
+
+def run_gunicorn(env, iterations, warmup, workers, concurrency):
+    import requests
+    import app as farm_app
+
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-w', str(workers), '-b', f'127.0.0.1:{port}',
+         '--log-level', 'warning', 'wsgi:app'],
+        cwd=str(ROOT), env=dict(os.environ, **env), stdout=subprocess.DEVNULL
+    )
+    try:
+        deadline = time.time() + 30
+        while True:
+            try:
+                requests.get(f"{base}/api/backup_status", timeout=5)
+                break
+            except requests.RequestException:
+                if time.time() > deadline or server.poll() is not None:
+                    raise RuntimeError("gunicorn did not start")
+                time.sleep(0.2)
+
+        local = threading.local()
+        results = {}
+
+        def one(method, path, kwargs):
+            if not hasattr(local, 'session'):
+                local.session = requests.Session()
+            started = time.perf_counter()
+            response = local.session.request(method, base + path, allow_redirects=False, timeout=60, **kwargs)
+            response.content
+            return (time.perf_counter() - started) * 1000, response.status_code, response.headers.get('X-Query-Count')
+
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for name, method, path, kwargs in scenarios(farm_app.app):
+                list(pool.map(lambda _: one(method, path, kwargs), range(warmup)))
+                outcomes = list(pool.map(lambda _: one(method, path, kwargs), range(iterations)))
+                latencies = [o[0] for o in outcomes]
+                queries = [int(o[2]) for o in outcomes if o[2] is not None]
+                errors = sum(1 for o in outcomes if o[1] >= 400)
+                results[name] = summarize(latencies, queries, errors)
+                results[name].update(method=method, path=path)
+                print(f"  {name:<32}p50 {results[name].get('p50_ms', '-'):>8} ms  p95 {results[name].get('p95_ms', '-'):>8} ms  "
+                      f"queries {results[name].get('queries_per_request')}")
+        return results, {'peak_rss_mb': _peak_rss_mb(server.pid), 'workers': workers, 'concurrency': concurrency}
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=str(ROOT), text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(old_path, new_path, threshold):
+    """Prints per-route p95 and query changes; returns True if nothing regressed past threshold."""
+    with open(old_path, 'r') as f:
+        old = json.load(f)
+    with open(new_path, 'r') as f:
+        new = json.load(f)
+
+    for key in ('driver', 'rows', 'iterations'):
+        if old['meta'].get(key) != new['meta'].get(key):
+            print(f"⚠️  Runs differ in {key}: {old['meta'].get(key)} vs {new['meta'].get(key)}")
+
+    ok = True
+    print(f"{'route':<32}{'p95 old':>10}{'p95 new':>10}{'change':>9}{'queries':>12}")
+    for name, after in new['routes'].items():
+        before = old['routes'].get(name)
+        if not before or 'p95_ms' not in before or 'p95_ms' not in after:
+            continue
+        change = (after['p95_ms'] - before['p95_ms']) / before['p95_ms'] if before['p95_ms'] else 0
+        more_queries = (after.get('queries_per_request') or 0) > (before.get('queries_per_request') or 0)
+        regressed = change > threshold or more_queries
+        ok = ok and not regressed
+        queries = f"{before.get('queries_per_request')}→{after.get('queries_per_request')}"
+        print(f"{name:<32}{before['p95_ms']:>10}{after['p95_ms']:>10}{change:>+9.0%}{queries:>12}  {'❌' if regressed else '✅'}")
+    return ok
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='End-to-end route benchmark with synthetic data and stubbed upstreams')
+    parser.add_argument('--driver', choices=['client', 'gunicorn'], default='client')
+    parser.add_argument('--rows', type=int, default=10000, help='Synthetic rows across all tables')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--iterations', type=int, default=30, help='Measured requests per route')
+    parser.add_argument('--warmup', type=int, default=3)
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent clients (gunicorn driver)')
+    parser.add_argument('--stub-latency-ms', type=float, default=0, help='Added latency on stubbed upstream calls')
+    parser.add_argument('--output', help='Results file (default: benchmarks/results/<time>_<driver>_<rows>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='Compare two result files and exit')
+    parser.add_argument('--threshold', type=float, default=0.2, help='p95 slowdown counted as a regression')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(0 if compare(args.compare[0], args.compare[1], args.threshold) else 1)
+
+    workdir = Path(tempfile.mkdtemp(prefix='farm_bench_'))
+    stub = None
+    try:
+        stub, env = prepare_environment(workdir, args.rows, args.seed, args.stub_latency_ms)
+        print(f"⏱️  {args.driver} driver, {args.iterations} requests per route")
+        if args.driver == 'client':
+            routes, process = run_client(args.iterations, args.warmup)
+        else:
+            routes, process = run_gunicorn(env, args.iterations, args.warmup, args.workers, args.concurrency)
+    finally:
+        if stub:
+            stub.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    started = datetime.datetime.now()
+    report = {
+        'meta': {
+            'driver': args.driver, 'rows': args.rows, 'seed': args.seed, 'iterations': args.iterations,
+            'stub_latency_ms': args.stub_latency_ms, 'git': git_revision(), 'python': platform.python_version(),
+            'timestamp': started.isoformat(timespec='seconds')
+        },
+        'process': process,
+        'routes': routes
+    }
+    output = Path(args.output) if args.output else RESULTS_DIR / f"{started:%Y%m%d_%H%M%S}_{args.driver}_{args.rows}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results saved to {output}")
@@ -0,0 +1,119 @@
+"""
+Concurrent read/write throughput of the SQLite database, default settings
+vs. the tuned pragmas in config.SQLITE_PRODUCTION_PRAGMAS.
+
+Mimics several gunicorn workers: reader processes run the dashboard-style
+queries while writer processes insert records and commit one at a time.
+
+Usage:
+    python benchmarks/sqlite_concurrency.py --readers 4 --writers 2 --seconds 5
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+
+from config import SQLITE_PRODUCTION_PRAGMAS
+from db_engine import apply_sqlite_pragmas
+
+SCHEMA = """
+CREATE TABLE farm_record (
+    id INTEGER PRIMARY KEY, date DATE, activity_type VARCHAR(50), category VARCHAR(50),
+    expense_type VARCHAR(50), amount FLOAT, description VARCHAR(200)
+)
+"""
+
+def make_engine(url, pragmas):
+    engine = create_engine(url)
+    apply_sqlite_pragmas(engine, pragmas)
+    return engine
+
+def seed(url, pragmas, rows):
+    engine = make_engine(url, pragmas)
+    with engine.begin() as conn:
+        conn.execute(text(SCHEMA))
+        conn.execute(
+            text("INSERT INTO farm_record (date, activity_type, category, expense_type, amount, description) "
+                 "VALUES (:date, 'Harvest', :category, 'Labour', :amount, 'seed row')"),
+            [{'date': f"2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}", 'category': 'Income' if i % 3 == 0 else 'Expense',
+              'amount': float(i % 500)} for i in range(rows)]
+        )
+    engine.dispose()
+
+def reader(url, pragmas, seconds, results):
+    engine = make_engine(url, pragmas)
+    done = errors = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            with engine.connect() as conn:
+                conn.execute(text("SELECT SUM(amount) FROM farm_record WHERE category = 'Income'")).scalar()
+                conn.execute(text("SELECT * FROM farm_record ORDER BY date DESC LIMIT 50")).fetchall()
+            done += 1
+        except OperationalError:
+            errors += 1
+    results.put(('read', done, errors))
+
+def writer(url, pragmas, seconds, results):
+    engine = make_engine(url, pragmas)
+    done = errors = 0
+    deadline = time.time() + seconds
+    while time.time() < deadline:
+        try:
+            with engine.begin() as conn:
+                conn.execute(text("INSERT INTO farm_record (date, activity_type, category, amount, description) "
+                                  "VALUES ('2026-01-01', 'Sowing', 'Expense', 120.0, 'bench write')"))
+            done += 1
+        except OperationalError:
+            errors += 1  # "database is locked"
+    results.put(('write', done, errors))
+
+def run(label, pragmas, readers, writers, seconds, rows):
+    with tempfile.TemporaryDirectory() as tmp:
+        url = f"sqlite:///{os.path.join(tmp, 'bench.db')}"
+        seed(url, pragmas, rows)
+        results = multiprocessing.Queue()
+        procs = [multiprocessing.Process(target=reader, args=(url, pragmas, seconds, results)) for _ in range(readers)]
+        procs += [multiprocessing.Process(target=writer, args=(url, pragmas, seconds, results)) for _ in range(writers)]
+        for p in procs:
+            p.start()
+        totals = {'read': [0, 0], 'write': [0, 0]}
+        for _ in procs:
+            kind, done, errors = results.get()
+            totals[kind][0] += done
+            totals[kind][1] += errors
+        for p in procs:
+            p.join()
+    return {
+        'config': label,
+        'reads_per_sec': round(totals['read'][0] / seconds, 1),
+        'writes_per_sec': round(totals['write'][0] / seconds, 1),
+        'read_errors': totals['read'][1],
+        'write_errors': totals['write'][1]
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--rows', type=int, default=20000)
+    args = parser.parse_args()
+
+    report = [
+        run('default', {}, args.readers, args.writers, args.seconds, args.rows),
+        run('tuned', SQLITE_PRODUCTION_PRAGMAS, args.readers, args.writers, args.seconds, args.rows),
+    ]
+    print(f"{'config':<10}{'reads/s':>12}{'writes/s':>12}{'read errs':>12}{'write errs':>12}")
+    for row in report:
+        print(f"{row['config']:<10}{row['reads_per_sec']:>12}{row['writes_per_sec']:>12}"
+              f"{row['read_errors']:>12}{row['write_errors']:>12}")
+    print(json.dumps(report))
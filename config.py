@@ -1,6 +1,27 @@
 import os
 from datetime import timedelta
 
+def engine_options(uri, pool_size=5, max_overflow=10):
+    """SQLAlchemy engine options suited to the database behind `uri`."""
+    if uri.startswith('postgresql'):
+        return {
+            'pool_size': pool_size,
+            'max_overflow': max_overflow,
+            'pool_pre_ping': True,   # drop connections the server closed while idle
+            'pool_recycle': 1800
+        }
+    return {}
+
+# Applied on every new SQLite connection (see db_engine.apply_sqlite_pragmas)
+SQLITE_PRODUCTION_PRAGMAS = {
+    'journal_mode': 'WAL',      # readers no longer wait behind the writer
+    'synchronous': 'NORMAL',    # safe with WAL; fsync only at checkpoints
+    'busy_timeout': 5000,       # wait up to 5s for the write lock instead of "database is locked"
+    'cache_size': -16000,       # 16 MB page cache per connection
+    'mmap_size': 134217728,     # 128 MB memory-mapped reads
+    'temp_store': 'MEMORY'
+}
+
 class Config:
     """Base configuration"""
     basedir = os.path.abspath(os.path.dirname(__file__))
@@ -15,12 +36,77 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = uri
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(uri)
+    SQLITE_PRAGMAS = SQLITE_PRODUCTION_PRAGMAS
     SECRET_KEY = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production')
     SESSION_COOKIE_SECURE = True
     SESSION_COOKIE_HTTPONLY = True
     SESSION_COOKIE_SAMESITE = 'Lax'
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
 
+    # Record SQL per request and flag N+1 patterns (see query_audit.py)
+    QUERY_AUDIT = os.environ.get('QUERY_AUDIT', '0') == '1'
+
+    # On-demand profiling (see request_profiler.py): requests carrying
+    # X-Profile-Token, plus a random PROFILING_SAMPLE_RATE share of traffic
+    PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED', '0') == '1'
+    PROFILING_TOKEN = os.environ.get('PROFILING_TOKEN')
+    PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0))
+    PROFILE_DIR = os.environ.get('PROFILE_DIR', os.path.join(instance_path, 'profiles'))
+    PROFILE_KEEP = int(os.environ.get('PROFILE_KEEP', 50))
+
+    # Per-worker metrics files merged by /metrics
+    METRICS_DIR = os.environ.get('METRICS_DIR', os.path.join(instance_path, 'metrics'))
+
+    # Cross-worker read cache (see shared_cache.py); commits invalidate it by model
+    CACHE_DIR = os.environ.get('CACHE_DIR', os.path.join(instance_path, 'cache'))
+    CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'sqlite')  # sqlite (shared by workers) or memory
+    CACHE_DEFAULT_TTL = int(os.environ.get('CACHE_DEFAULT_TTL', 3600))  # backstop for writes made outside the app
+    CACHE_MAX_ENTRIES = int(os.environ.get('CACHE_MAX_ENTRIES', 2000))
+    CACHE_MAX_BYTES = int(os.environ.get('CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    # Seconds a worker waits for another to finish computing the same entry
+    CACHE_LOCK_TIMEOUT = float(os.environ.get('CACHE_LOCK_TIMEOUT', 15))
+
+    # Rows per page on the yield and disease lists
+    LIST_PAGE_SIZE = int(os.environ.get('LIST_PAGE_SIZE', 50))
+
+    # Delta sync for offline clients (see sync.py)
+    SYNC_PAGE_SIZE = int(os.environ.get('SYNC_PAGE_SIZE', 500))
+    SYNC_MAX_PAGE_SIZE = int(os.environ.get('SYNC_MAX_PAGE_SIZE', 5000))
+    SYNC_MAX_BATCH = int(os.environ.get('SYNC_MAX_BATCH', 500))
+
+    # Operations per request on /api/batch (all applied in one transaction)
+    BATCH_MAX_OPERATIONS = int(os.environ.get('BATCH_MAX_OPERATIONS', 1000))
+
+    # Debounced auto-backup after writes (see backup_db.AutoBackup)
+    AUTO_BACKUP_ENABLED = os.environ.get('AUTO_BACKUP_ENABLED', '1') == '1'
+    AUTO_BACKUP_QUIET_SECONDS = int(os.environ.get('AUTO_BACKUP_QUIET_SECONDS', 60))
+    AUTO_BACKUP_MAX_WAIT_SECONDS = int(os.environ.get('AUTO_BACKUP_MAX_WAIT_SECONDS', 900))
+    AUTO_BACKUP_MIN_INTERVAL_SECONDS = int(os.environ.get('AUTO_BACKUP_MIN_INTERVAL_SECONDS', 900))
+
+    # Upstream APIs. Point these at stub_server.py for offline load testing.
+    GEMINI_API_BASE = os.environ.get('GEMINI_API_BASE', 'https://generativelanguage.googleapis.com/v1beta')
+    GEMINI_MODEL = os.environ.get('GEMINI_MODEL', 'gemini-1.5-flash')
+    OPEN_METEO_FORECAST_URL = os.environ.get('OPEN_METEO_FORECAST_URL', 'https://api.open-meteo.com/v1/forecast')
+    OPEN_METEO_ARCHIVE_URL = os.environ.get('OPEN_METEO_ARCHIVE_URL', 'https://archive-api.open-meteo.com/v1/archive')
+    OPENWEATHERMAP_URL = os.environ.get('OPENWEATHERMAP_URL', 'http://api.openweathermap.org/data/2.5/weather')
+
+    # First weather location, created when none exist; more are added on the weather page
+    FARM_LOCATION_NAME = os.environ.get('FARM_LOCATION_NAME', 'Home Farm')
+    FARM_LATITUDE = float(os.environ.get('FARM_LATITUDE', 26.1445))
+    FARM_LONGITUDE = float(os.environ.get('FARM_LONGITUDE', 91.7362))
+    # Seconds a location's forecast is reused before Open-Meteo is asked again
+    FORECAST_CACHE_SECONDS = int(os.environ.get('FORECAST_CACHE_SECONDS', 900))
+    # Locations whose daily weather each worker keeps in memory (least recently used dropped first)
+    WEATHER_SERIES_CACHE_SIZE = int(os.environ.get('WEATHER_SERIES_CACHE_SIZE', 32))
+
+    # AI usage limits (0 = unlimited). Budgets are shared by all workers;
+    # the concurrency cap applies per worker process.
+    AI_DAILY_TOKEN_BUDGET = int(os.environ.get('AI_DAILY_TOKEN_BUDGET', 0))
+    AI_DAILY_REQUEST_BUDGET = int(os.environ.get('AI_DAILY_REQUEST_BUDGET', 0))
+    AI_MAX_CONCURRENT_CALLS = int(os.environ.get('AI_MAX_CONCURRENT_CALLS', 4))
+    AI_QUEUE_TIMEOUT = float(os.environ.get('AI_QUEUE_TIMEOUT', 5))
+
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
@@ -31,11 +117,21 @@ class ProductionConfig(Config):
     DEBUG = False
     TESTING = False
     SESSION_COOKIE_SECURE = True
+    SQLALCHEMY_ENGINE_OPTIONS = engine_options(
+        Config.uri,
+        pool_size=int(os.environ.get('DB_POOL_SIZE', 5)),
+        max_overflow=int(os.environ.get('DB_MAX_OVERFLOW', 10))
+    )
 
 class TestingConfig(Config):
     """Testing configuration"""
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLITE_PRAGMAS = {}
+    CACHE_BACKEND = 'memory'
+    AUTO_BACKUP_ENABLED = False
+    QUERY_AUDIT = True
 
 config = {
     'development': DevelopmentConfig,
@@ -0,0 +1,46 @@
+"""
+Gunicorn settings (used by the Procfile). Bind address and worker count
+come from gunicorn's own PORT / WEB_CONCURRENCY handling.
+
+With preload_app the app is imported once in the master and workers fork
+from it, so each worker starts in milliseconds and shares the loaded code
+and reference data copy-on-write.
+"""
+import os
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+
+
+def _metrics_dir():
+    from config import Config
+    return Config.METRICS_DIR
+
+
+def on_starting(server):
+    # Counters start from zero with each server; nothing from the last run is summed
+    from request_metrics import clear_metrics_dir
+    clear_metrics_dir(_metrics_dir())
+
+
+def worker_exit(server, worker):
+    # Flushes are throttled, so write the last requests' counts before going
+    from request_metrics import flush
+    flush(force=True)
+
+
+def child_exit(server, worker):
+    # Keep the exited worker's counts (so totals never go down) without keeping its file
+    from request_metrics import mark_process_dead
+    mark_process_dead(worker.pid, _metrics_dir())
+
+
+def post_fork(server, worker):
+    import random
+    random.seed()  # workers would otherwise share the master's sampling sequence
+    if server.cfg.preload_app:
+        # Never reuse database connections opened in the master
+        from wsgi import app
+        from app import db
+        with app.app_context():
+            for engine in db.engines.values():
+                engine.dispose(close=False)
@@ -0,0 +1,66 @@
+"""
+Reference data from data/*.json (pest thresholds, pest and crop calendars,
+turmeric guide). Each file is read the first time it is used rather than
+at import, so scripts and workers that never touch it don't pay for it.
+"""
+import json
+from functools import cached_property
+from pathlib import Path
+
+DATA_DIR = Path(__file__).resolve().parent / 'data'
+
+
+def normalize_crop_name(name):
+    return " ".join(name.lower().split())
+
+
+class KnowledgeBase:
+    def __init__(self, data_dir=DATA_DIR):
+        self.data_dir = Path(data_dir)
+
+    def _load(self, filename, empty):
+        try:
+            with open(self.data_dir / filename, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Warning: Knowledge Base Load Error ({filename}) - {e}")
+            return empty
+
+    @cached_property
+    def pest_etl(self):
+        return self._load('pest_etl.json', {})
+
+    @cached_property
+    def pest_calendar(self):
+        return self._load('pest_calendar.json', [])
+
+    @cached_property
+    def crop_calendar(self):
+        return self._load('crop_calendar.json', [])
+
+    @cached_property
+    def turmeric(self):
+        return self._load('turmeric_data.json', {})
+
+    @cached_property
+    def crop_durations(self):
+        """Days from sowing to harvest, keyed by normalized crop name."""
+        durations = {}
+        for entry in self.crop_calendar:
+            if entry.get('duration_days'):
+                key = normalize_crop_name(entry['crop'])
+                durations[key] = entry['duration_days']
+                # "Rice (Sali - Winter)" also answers plain "rice" (first listed season wins)
+                durations.setdefault(key.split('(')[0].strip(), entry['duration_days'])
+        # Turmeric varieties (e.g. "Lakadong") share the turmeric duration
+        if 'turmeric' in durations:
+            for variety in self.turmeric.get('turmeric_varieties', []):
+                durations.setdefault(normalize_crop_name(variety['name']), durations['turmeric'])
+        return durations
+
+    def warm(self):
+        """Loads everything now (e.g. in the gunicorn master before workers fork)."""
+        return (self.pest_etl, self.pest_calendar, self.crop_calendar, self.turmeric, self.crop_durations)
+
+
+knowledge = KnowledgeBase()
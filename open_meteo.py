@@ -0,0 +1,102 @@
+"""
+Open-Meteo client for several farm locations at once.
+
+Open-Meteo accepts comma-separated coordinate lists and answers with one
+result per location (a JSON list, or a single object for one location),
+so the forecast or archive for every plot costs one upstream request.
+Forecasts are cached per location for a configurable number of seconds.
+"""
+import time
+
+import requests
+
+from shared_cache import SharedCache
+
+DAILY_FIELDS = ["weather_code", "temperature_2m_max", "temperature_2m_min", "precipitation_sum"]
+
+# WMO Weather Code Mapping
+WMO_CODES = {
+    0: "☀️ Clear Sky",
+    1: "🌤️ Mainly Clear", 2: "⛅ Partly Cloudy", 3: "☁️ Overcast",
+    45: "🌫️ Fog", 48: "🌫️ Rime Fog",
+    51: "DRIZZLE: Light", 53: "DRIZZLE: Moderate", 55: "DRIZZLE: Dense",
+    61: "Rain: Slight", 63: "RAINING: Moderate", 65: "RAINING: Heavy",
+    71: "SNOW: Slight", 73: "SNOW: Moderate", 75: "SNOW: Heavy",
+    77: "❄️ Snow Grains",
+    80: "SHOWERS: Slight", 81: "SHOWERS: Moderate", 82: "SHOWERS: Violent",
+    95: "⚡ Thunderstorm", 96: "⚡ Thunderstorm + Hail", 99: "⚡ Thunderstorm + Heavy Hail"
+}
+
+
+def describe(code):
+    return WMO_CODES.get(code, f"Code: {code}")
+
+
+def fetch_daily(url, coordinates, timeout=10, **params):
+    """
+    Daily data for [(lat, lon), ...] in one request. Returns one `daily`
+    block per coordinate, in the same order. Raises on upstream errors.
+    """
+    if not coordinates:
+        return []
+    query = {
+        "latitude": ",".join(f"{lat:.4f}" for lat, _ in coordinates),
+        "longitude": ",".join(f"{lon:.4f}" for _, lon in coordinates),
+        "daily": DAILY_FIELDS,
+        "timezone": "auto",
+        **params
+    }
+    response = requests.get(url, params=query, timeout=timeout)
+    data = response.json()
+    results = data if isinstance(data, list) else [data]
+    if response.status_code != 200 or len(results) != len(coordinates):
+        raise ValueError(f"Open-Meteo returned {response.status_code} for {len(coordinates)} locations")
+    return [result.get('daily') or {} for result in results]
+
+
+def forecast_days(daily):
+    """A `daily` block -> [{'date', 'temp', 'min_temp', 'desc', 'rain_prob'}] (rain_prob is the rain sum in mm)."""
+    lows = daily.get('temperature_2m_min') or [None] * len(daily.get('time', []))
+    return [{
+        'date': daily['time'][i],
+        'temp': daily['temperature_2m_max'][i],
+        'min_temp': lows[i],
+        'desc': describe(daily['weather_code'][i]),
+        'rain_prob': daily['precipitation_sum'][i]
+    } for i in range(len(daily.get('time', [])))]
+
+
+class ForecastCache:
+    """
+    Per-location forecasts; only expired locations are fetched, all in one request.
+    Entries live in `store` (a shared_cache.SharedCache), so with a shared backend
+    every worker serves the same forecasts and only one of them refreshes them.
+    """
+    KEEP_SECONDS = 86400  # how long a forecast is kept to fall back on when a refresh fails
+
+    def __init__(self, store=None):
+        self.store = store or SharedCache()
+
+    @staticmethod
+    def _key(coordinate):
+        return f"open_meteo:forecast:{coordinate[0]:.4f},{coordinate[1]:.4f}"
+
+    def get_many(self, url, coordinates, ttl, timeout=10):
+        """{(lat, lon): [day, ...]} for every coordinate ([] if never fetched successfully)."""
+        entries = {c: self.store.get(self._key(c)) for c in coordinates}
+        stale = [c for c, entry in entries.items() if entry is None or time.time() - entry['fetched_at'] >= ttl]
+        if stale:
+            with self.store.lock('open_meteo:forecast', timeout=timeout + 5):
+                # Another worker may have refreshed them while we waited
+                entries.update({c: self.store.get(self._key(c)) for c in stale})
+                stale = [c for c in stale if entries[c] is None or time.time() - entries[c]['fetched_at'] >= ttl]
+                if stale:
+                    try:
+                        fetched = fetch_daily(url, stale, timeout=timeout)
+                        for coordinate, daily in zip(stale, fetched):
+                            entries[coordinate] = {'fetched_at': time.time(), 'days': forecast_days(daily)}
+                            self.store.set(self._key(coordinate), entries[coordinate], ttl=max(ttl, self.KEEP_SECONDS))
+                    except Exception as e:
+                        # Keep serving the last good forecast, if any
+                        print(f"Weather Error: {e}")
+        return {c: entries[c]['days'] if entries[c] else [] for c in coordinates}
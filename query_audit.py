@@ -0,0 +1,156 @@
+"""
+Test-mode SQL auditor: records every statement per request, flags N+1
+patterns (the same statement shape repeated row after row) and checks
+per-route query budgets.
+
+Enabled when app.config['QUERY_AUDIT'] is true (on in TestingConfig).
+Each audited response carries X-Query-Count and X-Query-Repeats headers.
+
+In tests:
+    assert_query_budget(client, '/yield', 3)
+
+In CI (seeds an in-memory database and checks QUERY_BUDGETS):
+    python query_audit.py
+"""
+import re
+import sys
+
+from flask import g, has_request_context
+from sqlalchemy import event
+
+# Max statements per page view, with every table seeded (see check_budgets)
+QUERY_BUDGETS = {
+    '/yield': 3,
+    '/disease_log': 3,
+    '/crops': 2,
+    '/dashboard': 4,
+    '/reports': 6,
+    '/reminders': 5,
+    '/calendar': 5,
+    '/notes': 2,
+    '/daily_log': 2,
+    '/api/notes': 2,
+    '/weather_history': 2,
+    '/api/weather/analytics': 2,
+    '/api/weather/analytics?location=2': 2,
+    '/api/search?q=record': 1,
+    '/api/sync': 12,
+}
+
+# The same statement shape this many times in one request is reported as N+1
+N_PLUS_ONE_THRESHOLD = 3
+
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r"IN \((?:\?|__\[POSTCOMPILE_\w+\])(?:, ?(?:\?|__\[POSTCOMPILE_\w+\]))*\)", re.IGNORECASE)
+
+def statement_shape(statement):
+    """Normalizes a statement so per-row variants of one query compare equal."""
+    shape = _LITERALS.sub('?', statement)
+    shape = _IN_LISTS.sub('IN (?)', shape)
+    return ' '.join(shape.split())
+
+def repeated_shapes(statements, threshold=N_PLUS_ONE_THRESHOLD):
+    """{shape: count} for shapes executed at least `threshold` times."""
+    counts = {}
+    for statement in statements:
+        shape = statement_shape(statement)
+        counts[shape] = counts.get(shape, 0) + 1
+    return {shape: count for shape, count in counts.items() if count >= threshold}
+
+def init_query_audit(app, db):
+    if not app.config.get('QUERY_AUDIT'):
+        return
+
+    @app.before_request
+    def start_query_audit():
+        g.query_log = []
+
+    @app.after_request
+    def finish_query_audit(response):
+        statements = g.pop('query_log', None)
+        if statements is None:
+            return response
+        repeats = repeated_shapes(statements)
+        response.headers['X-Query-Count'] = str(len(statements))
+        response.headers['X-Query-Repeats'] = str(sum(repeats.values()))
+        for shape, count in repeats.items():
+            print(f"[N+1] {count}x {shape[:160]}")
+        return response
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def record_statement(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'query_log' in g:
+            g.query_log.append(statement)
+
+def assert_query_budget(client, path, budget, method='GET', **kwargs):
+    """Requests `path` and fails if it ran more than `budget` statements or any N+1 pattern."""
+    response = client.open(path, method=method, **kwargs)
+    count = int(response.headers.get('X-Query-Count', -1))
+    repeats = int(response.headers.get('X-Query-Repeats', 0))
+    assert count >= 0, "Query audit is off; set QUERY_AUDIT = True"
+    assert count <= budget, f"{path} ran {count} queries (budget {budget})"
+    assert repeats == 0, f"{path} has an N+1 pattern ({repeats} repeated statements)"
+    return response
+
+def seed_sample_data(db, models, rows=25):
+    """Enough rows in every table that per-row lazy loads show up as N+1."""
+    import datetime
+    today = datetime.date.today()
+    home = models['WeatherLocation'](name='Home Farm', latitude=26.14, longitude=91.74, is_default=True)
+    plot = models['WeatherLocation'](name='Upper Plot', latitude=26.75, longitude=94.2)
+    db.session.add_all([home, plot])
+    db.session.flush()
+    crops = [models['Crop'](crop_name=f"Crop {i}", season='Rabi', area='1 Bigha', sowing_date=today,
+                            location_id=plot.id if i % 2 else None) for i in range(5)]
+    db.session.add_all(crops)
+    db.session.flush()
+    for i in range(rows):
+        day = today - datetime.timedelta(days=i)
+        crop = crops[i % len(crops)]
+        db.session.add_all([
+            models['FarmRecord'](date=day, activity_type='Harvest', category='Income' if i % 2 else 'Expense',
+                                 expense_type='Labour', amount=100 + i, description=f"record {i}"),
+            models['Yield'](date=day, crop_id=crop.id, yield_value=i, unit='kg', yield_in_kg=i),
+            models['DiseaseLog'](date=day, crop_id=crop.id, disease_name='Blight', severity='Mild'),
+            models['Reminder'](date=day, title=f"Reminder {i}"),
+            models['Note'](content=f"note {i}", created_at=datetime.datetime.combine(day, datetime.time(9))),
+            models['WeatherLog'](location_id=home.id, date=day, max_temp=30, rainfall=1.0, description='Clear'),
+            models['WeatherLog'](location_id=plot.id, date=day, max_temp=28, rainfall=3.0, description='Rain'),
+        ])
+    irrigation = models['Reminder'](date=today - datetime.timedelta(days=rows), title='Irrigate', rrule='FREQ=DAILY;INTERVAL=3')
+    db.session.add(irrigation)
+    db.session.flush()
+    db.session.add(models['ReminderCompletion'](reminder_id=irrigation.id, occurrence_date=irrigation.date))
+    db.session.commit()
+
+def check_budgets(budgets=QUERY_BUDGETS, rows=25):
+    """Seeds an in-memory database and checks every route budget. Returns True if all pass."""
+    import app as farm_app
+
+    flask_app = farm_app.create_app('testing')
+    with flask_app.app_context():
+        farm_app.db.create_all()
+        seed_sample_data(farm_app.db, vars(farm_app), rows=rows)
+
+    client = flask_app.test_client()
+    ok = True
+    print(f"{'route':<20}{'queries':>8}{'budget':>8}{'repeats':>9}")
+    for path, budget in budgets.items():
+        try:
+            response = client.get(path)
+        except Exception as e:
+            ok = False
+            print(f"{path:<20}{'error':>8}{budget:>8}{'-':>9}  ❌ {e}")
+            continue
+        count = int(response.headers.get('X-Query-Count', -1))
+        repeats = int(response.headers.get('X-Query-Repeats', 0))
+        passed = response.status_code == 200 and 0 <= count <= budget and repeats == 0
+        ok = ok and passed
+        print(f"{path:<20}{count:>8}{budget:>8}{repeats:>9}  {'✅' if passed else '❌'}")
+    return ok
+
+if __name__ == '__main__':
+    sys.exit(0 if check_budgets() else 1)
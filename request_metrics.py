@@ -0,0 +1,301 @@
+"""
+Per-route request metrics in Prometheus text format.
+
+Each worker process keeps its own counters and periodically writes them to
+METRICS_DIR/worker_<pid>.json; /metrics sums every worker's file, so the
+numbers are correct no matter which gunicorn worker answers the scrape.
+When a worker exits its file is folded into dead_workers.json and removed
+(gunicorn's child_exit calls mark_process_dead), so restarted workers
+neither pile up files nor make a counter go down. The directory is
+cleared when the server starts.
+"""
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from urllib.parse import urlparse
+
+try:
+    import fcntl
+except ImportError:  # Windows (no gunicorn there; the dev server is one process)
+    fcntl = None
+
+import requests
+from flask import g, request, has_request_context
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+METRIC_HELP = {
+    'farm_http_requests_total': ('counter', 'Requests handled, by route and status'),
+    'farm_http_request_duration_seconds': ('histogram', 'Request latency by route'),
+    'farm_sql_queries_total': ('counter', 'SQL statements executed, by route'),
+    'farm_sql_duration_seconds_total': ('counter', 'Time spent in SQL, by route'),
+    'farm_sql_queries_per_request': ('histogram', 'SQL statements per request, by route'),
+    'farm_outbound_http_requests_total': ('counter', 'Upstream HTTP calls, by route and host'),
+    'farm_outbound_http_duration_seconds_total': ('counter', 'Time waiting on upstream HTTP, by route and host'),
+}
+
+
+class MetricsRegistry:
+    """Counters and histograms for one process, keyed by (metric, labels)."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {}
+        self.histograms = {}
+
+    @staticmethod
+    def _key(name, labels):
+        return json.dumps([name, sorted(labels.items())])
+
+    def inc(self, name, labels, amount=1.0):
+        key = self._key(name, labels)
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def observe(self, name, labels, value, buckets):
+        key = self._key(name, labels)
+        with self.lock:
+            hist = self.histograms.get(key)
+            if hist is None:
+                hist = self.histograms[key] = {'buckets': list(buckets), 'counts': [0] * len(buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(hist['buckets']):
+                if value <= bound:
+                    hist['counts'][i] += 1
+            hist['sum'] += value
+            hist['count'] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return json.loads(json.dumps({'counters': self.counters, 'histograms': self.histograms}))
+
+
+registry = MetricsRegistry()
+_state = {'dir': None, 'last_flush': 0.0, 'flush_interval': 1.0}
+
+
+def flush(force=False):
+    """Writes this worker's metrics file (throttled unless force=True)."""
+    if not _state['dir']:
+        return
+    now = time.time()
+    if not force and now - _state['last_flush'] < _state['flush_interval']:
+        return
+    _state['last_flush'] = now
+    path = _state['dir'] / f'worker_{os.getpid()}.json'
+    tmp = path.with_suffix('.tmp')
+    with open(tmp, 'w') as f:
+        json.dump(registry.snapshot(), f)
+    os.replace(tmp, path)
+
+
+DEAD_WORKERS_FILE = 'dead_workers.json'
+
+
+class _DirLock:
+    """Serialises folding and merging across processes (a no-op without fcntl)."""
+
+    def __init__(self, directory):
+        self.path = Path(directory) / '.lock'
+
+    def __enter__(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.file = open(self.path, 'a+')
+        if fcntl:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        self.file.close()  # closing releases the lock
+
+
+def _read(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _add(total, data):
+    for key, value in data['counters'].items():
+        total['counters'][key] = total['counters'].get(key, 0) + value
+    for key, hist in data['histograms'].items():
+        merged = total['histograms'].get(key)
+        if merged is None:
+            total['histograms'][key] = hist
+            continue
+        merged['counts'] = [a + b for a, b in zip(merged['counts'], hist['counts'])]
+        merged['sum'] += hist['sum']
+        merged['count'] += hist['count']
+    return total
+
+
+def mark_process_dead(pid, metrics_dir=None):
+    """Folds an exited worker's counters into the dead-workers total and removes its file."""
+    directory = Path(metrics_dir or _state['dir'])
+    path = directory / f'worker_{pid}.json'
+    with _DirLock(directory):
+        data = _read(path)
+        if data is not None:
+            dead_path = directory / DEAD_WORKERS_FILE
+            total = _add(_read(dead_path) or {'counters': {}, 'histograms': {}}, data)
+            tmp = dead_path.with_suffix('.tmp')
+            with open(tmp, 'w') as f:
+                json.dump(total, f)
+            os.replace(tmp, dead_path)
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def clear_metrics_dir(metrics_dir):
+    """Drops every worker's and the dead-workers file (called once when the server starts)."""
+    directory = Path(metrics_dir)
+    for path in [*directory.glob('worker_*.json'), directory / DEAD_WORKERS_FILE]:
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _alive(pid):
+    if os.name == 'nt':
+        return True  # os.kill would terminate it
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _fold_stale_files():
+    """Folds files left by workers that died without child_exit (or an earlier owner of our pid)."""
+    for path in _state['dir'].glob('worker_*.json'):
+        try:
+            pid = int(path.stem[len('worker_'):])
+        except ValueError:
+            continue
+        if pid == os.getpid() or not _alive(pid):
+            mark_process_dead(pid)
+
+
+def _merged():
+    """Sums the metrics files of every worker (including this one and exited ones)."""
+    flush(force=True)
+    total = {'counters': {}, 'histograms': {}}
+    with _DirLock(_state['dir']):
+        for path in [*_state['dir'].glob('worker_*.json'), _state['dir'] / DEAD_WORKERS_FILE]:
+            data = _read(path)
+            if data is not None:
+                _add(total, data)
+    return total['counters'], total['histograms']
+
+
+def _labels_text(pairs, extra=None):
+    pairs = list(pairs) + (extra or [])
+    if not pairs:
+        return ''
+    escaped = [(k, str(v).replace('\\', '\\\\').replace('"', '\\"')) for k, v in pairs]
+    return '{' + ','.join(f'{k}="{v}"' for k, v in escaped) + '}'
+
+
+def render_prometheus():
+    counters, histograms = _merged()
+    by_name = {}
+    for key, value in counters.items():
+        name, pairs = json.loads(key)
+        by_name.setdefault(name, []).append(f"{name}{_labels_text(pairs)} {value}")
+    for key, hist in histograms.items():
+        name, pairs = json.loads(key)
+        lines = by_name.setdefault(name, [])
+        for bound, count in zip(hist['buckets'], hist['counts']):
+            lines.append(f"{name}_bucket{_labels_text(pairs, [('le', bound)])} {count}")
+        lines.append(f"{name}_bucket{_labels_text(pairs, [('le', '+Inf')])} {hist['count']}")
+        lines.append(f"{name}_sum{_labels_text(pairs)} {hist['sum']}")
+        lines.append(f"{name}_count{_labels_text(pairs)} {hist['count']}")
+
+    output = []
+    for name in sorted(by_name):
+        kind, help_text = METRIC_HELP.get(name, ('untyped', name))
+        output.append(f"# HELP {name} {help_text}")
+        output.append(f"# TYPE {name} {kind}")
+        output.extend(sorted(by_name[name]))
+    return '\n'.join(output) + '\n'
+
+
+def _route_label():
+    return request.url_rule.rule if request.url_rule else 'unmatched'
+
+
+def init_metrics(app, db):
+    """Installs request timing, SQL counting and outbound HTTP timing."""
+    _state['dir'] = Path(app.config['METRICS_DIR'])
+    _state['dir'].mkdir(parents=True, exist_ok=True)
+    _fold_stale_files()
+
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.sql_count = 0
+        g.sql_time = 0.0
+        g.http_calls = {}
+
+    @app.after_request
+    def record_request_metrics(response):
+        start = g.pop('metrics_start', None)
+        if start is None:
+            return response
+        route = _route_label()
+        labels = {'route': route, 'method': request.method}
+        registry.inc('farm_http_requests_total', dict(labels, status=response.status_code))
+        registry.observe('farm_http_request_duration_seconds', labels, time.perf_counter() - start, LATENCY_BUCKETS)
+        registry.inc('farm_sql_queries_total', {'route': route}, g.sql_count)
+        registry.inc('farm_sql_duration_seconds_total', {'route': route}, g.sql_time)
+        registry.observe('farm_sql_queries_per_request', {'route': route}, g.sql_count, QUERY_BUCKETS)
+        for host, (calls, seconds) in g.http_calls.items():
+            registry.inc('farm_outbound_http_requests_total', {'route': route, 'host': host}, calls)
+            registry.inc('farm_outbound_http_duration_seconds_total', {'route': route, 'host': host}, seconds)
+        flush()
+        return response
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def sql_timer_start(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('metrics_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def sql_timer_stop(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['metrics_query_start'].pop()
+        if has_request_context() and 'sql_count' in g:
+            g.sql_count += 1
+            g.sql_time += time.perf_counter() - started
+
+    @event.listens_for(engine, 'handle_error')
+    def sql_timer_discard(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('metrics_query_start'):
+            conn.info['metrics_query_start'].pop()
+
+    # Every requests.get/post goes through Session.send
+    original_send = requests.Session.send
+    if not getattr(original_send, 'metrics_wrapped', False):
+        def timed_send(session, prepared_request, **kwargs):
+            started = time.perf_counter()
+            try:
+                return original_send(session, prepared_request, **kwargs)
+            finally:
+                if has_request_context() and 'http_calls' in g:
+                    host = urlparse(prepared_request.url).netloc
+                    calls, seconds = g.http_calls.get(host, (0, 0.0))
+                    g.http_calls[host] = (calls + 1, seconds + time.perf_counter() - started)
+        timed_send.metrics_wrapped = True
+        requests.Session.send = timed_send
@@ -0,0 +1,193 @@
+"""
+Opt-in per-request profiling for production.
+
+With PROFILING_ENABLED set, a request is profiled when it sends
+`X-Profile-Token: <PROFILING_TOKEN>` or is picked by PROFILING_SAMPLE_RATE.
+The view runs under cProfile and every SQL statement is timed; both are
+written to PROFILE_DIR as <id>.prof (open with pstats or snakeviz) and
+<id>.json (top functions + SQL timeline). Only the newest PROFILE_KEEP
+profiles are kept.
+
+    curl -H "X-Profile-Token: $PROFILING_TOKEN" https://farm.example/dashboard
+    curl -H "X-Profile-Token: $PROFILING_TOKEN" https://farm.example/api/profiles
+"""
+import cProfile
+import datetime
+import hmac
+import io
+import itertools
+import json
+import os
+import pstats
+import random
+import time
+from pathlib import Path
+
+from flask import g, request, jsonify, abort, send_file, has_request_context
+from sqlalchemy import event
+
+TOKEN_HEADER = 'X-Profile-Token'
+TOP_FUNCTIONS = 40
+
+_sequence = itertools.count()
+
+
+def _token_matches(token):
+    # Constant-time, so response timing doesn't reveal how much of a guess was right
+    return hmac.compare_digest(request.headers.get(TOKEN_HEADER, '').encode(), token.encode())
+
+def _selected(app):
+    token = app.config.get('PROFILING_TOKEN')
+    if token and _token_matches(token):
+        return True
+    rate = app.config.get('PROFILING_SAMPLE_RATE') or 0
+    return rate > 0 and random.random() < rate
+
+
+def _authorized(app):
+    token = app.config.get('PROFILING_TOKEN')
+    return bool(token) and _token_matches(token)
+
+
+def _top_functions(profiler, limit=TOP_FUNCTIONS):
+    """[(function, calls, own_ms, cumulative_ms)] sorted by cumulative time."""
+    stats = pstats.Stats(profiler, stream=io.StringIO())
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        rows.append({
+            'function': f"{'/'.join(Path(filename).parts[-2:])}:{line}({name})",
+            'calls': calls,
+            'own_ms': round(own * 1000, 3),
+            'cumulative_ms': round(cumulative * 1000, 3)
+        })
+    rows.sort(key=lambda r: r['cumulative_ms'], reverse=True)
+    return rows[:limit]
+
+
+def _rotate(profile_dir, keep):
+    profiles = sorted(profile_dir.glob('*.json'), reverse=True)
+    for old in profiles[keep:]:
+        old.unlink(missing_ok=True)
+        old.with_suffix('.prof').unlink(missing_ok=True)
+
+
+def init_profiler(app, db):
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+    profile_dir = Path(app.config['PROFILE_DIR'])
+    profile_dir.mkdir(parents=True, exist_ok=True)
+
+    @app.before_request
+    def start_profile():
+        if request.path.startswith('/api/profiles') or not _selected(app):
+            return
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            return  # another profiler is already running on this interpreter
+        g.profiler = profiler
+        g.profile_started = time.perf_counter()
+        g.profile_sql = []
+
+    @app.after_request
+    def finish_profile(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        profiler.disable()
+        elapsed_ms = (time.perf_counter() - g.profile_started) * 1000
+        sql = g.pop('profile_sql', [])
+
+        profile_id = f"{datetime.datetime.now():%Y%m%d_%H%M%S}_{os.getpid()}_{next(_sequence):06d}"
+        profiler.dump_stats(str(profile_dir / f"{profile_id}.prof"))
+        summary = {
+            'id': profile_id,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'route': request.url_rule.rule if request.url_rule else None,
+            'status': response.status_code,
+            'captured_at': datetime.datetime.now().isoformat(timespec='seconds'),
+            'duration_ms': round(elapsed_ms, 2),
+            'sql_count': len(sql),
+            'sql_ms': round(sum(q['duration_ms'] for q in sql), 2),
+            'functions': _top_functions(profiler),
+            'sql': sql
+        }
+        tmp = profile_dir / f"{profile_id}.tmp"
+        with open(tmp, 'w') as f:
+            json.dump(summary, f, indent=1)
+        os.replace(tmp, profile_dir / f"{profile_id}.json")
+        _rotate(profile_dir, app.config['PROFILE_KEEP'])
+
+        response.headers['X-Profile-Id'] = profile_id
+        print(f"🔬 Profiled {request.method} {request.path} in {elapsed_ms:.0f}ms ({len(sql)} queries) -> {profile_id}")
+        return response
+
+    @app.teardown_request
+    def stop_profile(exception=None):
+        # Requests that raised before after_request ran
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def profile_query_start(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'profile_sql' in g:
+            conn.info.setdefault('profile_query_start', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def profile_query_stop(conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'profile_sql' in g and conn.info.get('profile_query_start'):
+            started = conn.info['profile_query_start'].pop()
+            g.profile_sql.append({
+                'offset_ms': round((started - g.profile_started) * 1000, 3),
+                'duration_ms': round((time.perf_counter() - started) * 1000, 3),
+                'statement': ' '.join(statement.split())[:500]
+            })
+
+    @event.listens_for(engine, 'handle_error')
+    def profile_query_discard(exception_context):
+        conn = exception_context.connection
+        if conn is not None and conn.info.get('profile_query_start'):
+            conn.info['profile_query_start'].pop()
+
+    # --- admin endpoints (token required) ---
+    @app.route('/api/profiles')
+    def list_profiles():
+        if not _authorized(app):
+            abort(404)
+        limit = min(request.args.get('limit', 20, type=int), 200)
+        profiles = []
+        for path in sorted(profile_dir.glob('*.json'), reverse=True)[:limit]:
+            try:
+                with open(path, 'r') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            data.pop('functions', None)
+            data.pop('sql', None)
+            profiles.append(data)
+        return jsonify({"status": "success", "profiles": profiles})
+
+    @app.route('/api/profiles/<profile_id>')
+    def get_profile(profile_id):
+        if not _authorized(app):
+            abort(404)
+        path = profile_dir / f"{Path(profile_id).name}.json"
+        if not path.exists():
+            return jsonify({"status": "error", "message": f"Profile {profile_id} not found"}), 404
+        with open(path, 'r') as f:
+            return jsonify({"status": "success", "profile": json.load(f)})
+
+    @app.route('/api/profiles/<profile_id>/download')
+    def download_profile(profile_id):
+        if not _authorized(app):
+            abort(404)
+        path = profile_dir / f"{Path(profile_id).name}.prof"
+        if not path.exists():
+            return jsonify({"status": "error", "message": f"Profile {profile_id} not found"}), 404
+        return send_file(path.resolve(), as_attachment=True, download_name=path.name)
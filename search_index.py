@@ -0,0 +1,187 @@
+"""
+Full-text search over notes, farm records, disease logs and yields.
+
+One index table holds a row per source row, kept in sync by database
+triggers (so bulk inserts, restores and other scripts are covered too):
+
+  SQLite      FTS5 virtual table `search_index`, ranked by bm25()
+  PostgreSQL  table `search_document` with a stored tsvector + GIN index,
+              ranked by ts_rank()
+
+The DDL runs after every `db.create_all()` and is idempotent; when the
+index is created on an existing database it is filled from the source
+tables. `flask reindex-search` rebuilds it from scratch.
+"""
+import html
+import re
+
+from sqlalchemy import event, inspect, text
+
+# kind -> (code, table, date column, indexed text). The index row id is
+# source id * ID_STRIDE + code, so triggers update by primary key.
+SOURCES = {
+    'note': (1, 'note', 'created_at', ['content']),
+    'record': (2, 'farm_record', 'date', ['activity_type', 'expense_type', 'description']),
+    'disease': (3, 'disease_log', 'date', ['disease_name', 'treatment', 'notes']),
+    'yield': (4, 'yield', 'date', ['notes']),
+}
+ID_STRIDE = 8
+
+# Highlight markers: private-use characters that can't clash with user text
+MARK_START, MARK_END = '\ue000', '\ue001'
+
+_TOKENS = re.compile(r'\w+', re.UNICODE)
+
+
+def _body(row, columns):
+    return " || ' ' || ".join(f"coalesce({row}.{column}, '')" for column in columns)
+
+
+def _day(row, column):
+    return f"substr(CAST({row}.{column} AS TEXT), 1, 10)"
+
+
+def _values(kind, row):
+    code, _, date_column, columns = SOURCES[kind]
+    return f"{row}.id * {ID_STRIDE} + {code}, '{kind}', {row}.id, {_day(row, date_column)}, {_body(row, columns)}"
+
+
+# --- SQLite (FTS5) ---
+def _sqlite_ddl():
+    statements = [
+        "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+        "body, kind UNINDEXED, ref_id UNINDEXED, day UNINDEXED, tokenize='porter unicode61 remove_diacritics 2')"
+    ]
+    for kind, (code, table, _, columns) in SOURCES.items():
+        insert = f"INSERT INTO search_index(rowid, kind, ref_id, day, body) VALUES ({_values(kind, 'NEW')});"
+        delete = f"DELETE FROM search_index WHERE rowid = OLD.id * {ID_STRIDE} + {code};"
+        statements += [
+            f'CREATE TRIGGER IF NOT EXISTS search_{kind}_insert AFTER INSERT ON "{table}" BEGIN {insert} END',
+            f'CREATE TRIGGER IF NOT EXISTS search_{kind}_update AFTER UPDATE ON "{table}" BEGIN {delete} {insert} END',
+            f'CREATE TRIGGER IF NOT EXISTS search_{kind}_delete AFTER DELETE ON "{table}" BEGIN {delete} END',
+        ]
+    return statements
+
+
+def _sqlite_match(query):
+    """User text -> FTS5 query: every word must appear, the last as a prefix."""
+    tokens = _TOKENS.findall(query)
+    if not tokens:
+        return None
+    return ' '.join(f'"{t}"' for t in tokens[:-1]) + (' ' if len(tokens) > 1 else '') + f'"{tokens[-1]}"*'
+
+
+# --- PostgreSQL (tsvector) ---
+def _postgres_ddl():
+    statements = [
+        "CREATE TABLE IF NOT EXISTS search_document ("
+        "id BIGINT PRIMARY KEY, kind VARCHAR(20) NOT NULL, ref_id INTEGER NOT NULL, day VARCHAR(10), body TEXT, "
+        "tsv TSVECTOR GENERATED ALWAYS AS (to_tsvector('english', coalesce(body, ''))) STORED)",
+        "CREATE INDEX IF NOT EXISTS ix_search_document_tsv ON search_document USING GIN (tsv)",
+    ]
+    for kind, (code, table, _, _) in SOURCES.items():
+        statements += [
+            f"""CREATE OR REPLACE FUNCTION search_sync_{kind}() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP <> 'INSERT' THEN
+        DELETE FROM search_document WHERE id = OLD.id * {ID_STRIDE} + {code};
+    END IF;
+    IF TG_OP <> 'DELETE' THEN
+        INSERT INTO search_document (id, kind, ref_id, day, body) VALUES ({_values(kind, 'NEW')});
+    END IF;
+    RETURN NULL;
+END $$ LANGUAGE plpgsql""",
+            f'DROP TRIGGER IF EXISTS search_sync_{kind} ON "{table}"',
+            f'CREATE TRIGGER search_sync_{kind} AFTER INSERT OR UPDATE OR DELETE ON "{table}" '
+            f'FOR EACH ROW EXECUTE FUNCTION search_sync_{kind}()',
+        ]
+    return statements
+
+
+def _index_table(dialect):
+    return 'search_index' if dialect == 'sqlite' else 'search_document'
+
+
+def _ready(connection):
+    tables = set(inspect(connection).get_table_names())
+    return all(table in tables for _, table, _, _ in SOURCES.values())
+
+
+def rebuild(connection):
+    """Refills the index from the source tables. Returns the number of rows indexed."""
+    index_table = _index_table(connection.dialect.name)
+    columns = 'rowid, kind, ref_id, day, body' if index_table == 'search_index' else 'id, kind, ref_id, day, body'
+    connection.execute(text(f"DELETE FROM {index_table}"))
+    for kind, (_, table, _, _) in SOURCES.items():
+        connection.execute(text(f'INSERT INTO {index_table} ({columns}) SELECT {_values(kind, "src")} FROM "{table}" src'))
+    return connection.execute(text(f"SELECT count(*) FROM {index_table}")).scalar()
+
+
+def create_search_index(connection):
+    """Creates the index table and triggers if missing (backfilling a new index)."""
+    dialect = connection.dialect.name
+    if dialect not in ('sqlite', 'postgresql') or not _ready(connection):
+        return False
+    existed = inspect(connection).has_table(_index_table(dialect))
+    try:
+        for statement in (_sqlite_ddl() if dialect == 'sqlite' else _postgres_ddl()):
+            connection.exec_driver_sql(statement)
+    except Exception as e:
+        print(f"⚠️ Full-text search unavailable: {e}")
+        return False
+    if not existed:
+        count = rebuild(connection)
+        if count:
+            print(f"🔎 Indexed {count} rows for search")
+    return True
+
+
+def init_search(db):
+    if not event.contains(db.metadata, 'after_create', _after_create):
+        event.listen(db.metadata, 'after_create', _after_create)
+
+
+def _after_create(target, connection, **kw):
+    create_search_index(connection)
+
+
+def highlight(snippet):
+    """Escapes a snippet and turns the match markers into <mark> tags."""
+    escaped = html.escape(snippet or '')
+    return escaped.replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+
+
+def search(session, query, kinds=None, sort='rank', limit=20, offset=0):
+    """
+    Ranked matches for `query` as dicts (kind, id, date, snippet), best first,
+    or newest first with sort='recent'. Returns [] for an empty query.
+    """
+    kinds = [k for k in (kinds or SOURCES) if k in SOURCES]
+    if not kinds:
+        return []
+    params = {'limit': limit, 'offset': offset}
+    kind_filter = ' AND kind IN (' + ', '.join(f"'{k}'" for k in kinds) + ')' if len(kinds) < len(SOURCES) else ''
+
+    if session.get_bind().dialect.name == 'sqlite':
+        params['q'] = _sqlite_match(query)
+        if params['q'] is None:
+            return []
+        order = 'day DESC, rank' if sort == 'recent' else 'rank'
+        statement = (
+            f"SELECT kind, ref_id, day, snippet(search_index, 0, '{MARK_START}', '{MARK_END}', '…', 16) AS snippet, "
+            f"bm25(search_index) AS rank FROM search_index WHERE search_index MATCH :q{kind_filter} "
+            f"ORDER BY {order} LIMIT :limit OFFSET :offset"
+        )
+    else:
+        params['q'] = query.strip()
+        if not params['q']:
+            return []
+        order = 'day DESC, rank DESC' if sort == 'recent' else 'rank DESC'
+        statement = (
+            f"SELECT kind, ref_id, day, ts_headline('english', body, q, "
+            f"'StartSel={MARK_START}, StopSel={MARK_END}, MaxWords=24, MinWords=8') AS snippet, "
+            f"ts_rank(tsv, q) AS rank FROM search_document, websearch_to_tsquery('english', :q) q "
+            f"WHERE tsv @@ q{kind_filter} ORDER BY {order} LIMIT :limit OFFSET :offset"
+        )
+    return [{'kind': row.kind, 'id': int(row.ref_id), 'date': row.day, 'snippet': highlight(row.snippet)}
+            for row in session.execute(text(statement), params)]
@@ -0,0 +1,361 @@
+"""
+Cache shared by every gunicorn worker, with write-driven invalidation.
+
+    shared_cache.get_or_set('reports:summary', compute, ttl=3600, tags=('FarmRecord', 'Yield'))
+    shared_cache.invalidate(['FarmRecord'])   # done by app.py after every commit that wrote FarmRecord
+
+Entries carry the versions of their tags (model names) as they were when
+the value was computed. Invalidating a tag bumps its version, so anything
+computed before the write reads as a miss, including values that were
+still being computed while the write committed.
+
+Backends:
+  sqlite  one SQLite file under CACHE_DIR (WAL), shared by all workers on the host
+  memory  a dict in this process (tests, single-process runs)
+
+Both bound the cache by entry count and total bytes, evicting the least
+recently used entries first. get_or_set() holds a per-key lock (a row in
+the SQLite file, or a thread lock) while computing, so a cold key is
+computed once and the other workers wait for it instead of piling onto
+the database or the upstream API.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+
+MISSING = object()
+DEFAULT_TTL = 3600
+# LRU timestamps are refreshed at most this often per entry (reads stay read-only)
+TOUCH_INTERVAL = 10
+
+
+class CacheBackend(ABC):
+    """What SharedCache needs from a store. Values arrive pickled."""
+
+    @abstractmethod
+    def load(self, key):
+        """(data, expires_at, is_stale) or None."""
+
+    @abstractmethod
+    def store(self, key, data, expires_at, tag_versions):
+        """Saves an entry, evicting others if the store is over its bounds."""
+
+    @abstractmethod
+    def delete(self, key):
+        """Drops one entry."""
+
+    @abstractmethod
+    def tag_versions(self, tags):
+        """{tag: version} for these tags (0 for tags never invalidated)."""
+
+    @abstractmethod
+    def bump(self, tags):
+        """Increments each tag's version."""
+
+    @abstractmethod
+    def try_lock(self, name, token, lease):
+        """Takes the named lock for `lease` seconds without waiting. Returns True if taken."""
+
+    @abstractmethod
+    def unlock(self, name, token):
+        """Releases the lock if `token` still holds it."""
+
+    @abstractmethod
+    def clear(self):
+        """Drops every entry and lock (tag versions are kept)."""
+
+
+class SQLiteBackend(CacheBackend):
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache_entry (
+            key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL,
+            expires_at REAL NOT NULL, accessed_at REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS ix_cache_entry_accessed_at ON cache_entry (accessed_at);
+        CREATE TABLE IF NOT EXISTS cache_entry_tag (
+            key TEXT NOT NULL REFERENCES cache_entry (key) ON DELETE CASCADE,
+            tag TEXT NOT NULL, version INTEGER NOT NULL, PRIMARY KEY (key, tag));
+        CREATE TABLE IF NOT EXISTS cache_tag (tag TEXT PRIMARY KEY, version INTEGER NOT NULL);
+        CREATE TABLE IF NOT EXISTS cache_lock (name TEXT PRIMARY KEY, token TEXT NOT NULL, expires_at REAL NOT NULL);
+    """
+
+    def __init__(self, path, max_entries=2000, max_bytes=64 * 1024 * 1024):
+        self.path = Path(path)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+
+    def _db(self):
+        # One connection per thread and process (connections must not cross a fork)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), timeout=5, isolation_level=None, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            conn.execute('PRAGMA foreign_keys=ON')
+            conn.executescript(self.SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def load(self, key):
+        now = time.time()
+        row = self._db().execute(
+            "SELECT e.data, e.expires_at, e.accessed_at, EXISTS ("
+            "  SELECT 1 FROM cache_entry_tag et LEFT JOIN cache_tag t ON t.tag = et.tag"
+            "  WHERE et.key = e.key AND coalesce(t.version, 0) != et.version) "
+            "FROM cache_entry e WHERE e.key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        data, expires_at, accessed_at, stale = row
+        if not stale and expires_at > now and now - accessed_at > TOUCH_INTERVAL:
+            self._db().execute("UPDATE cache_entry SET accessed_at = ? WHERE key = ?", (now, key))
+        return data, expires_at, bool(stale)
+
+    def store(self, key, data, expires_at, tag_versions):
+        db = self._db()
+        now = time.time()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("INSERT INTO cache_entry (key, data, size, expires_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                       "ON CONFLICT (key) DO UPDATE SET data = excluded.data, size = excluded.size, "
+                       "expires_at = excluded.expires_at, accessed_at = excluded.accessed_at",
+                       (key, data, len(data), expires_at, now))
+            db.execute("DELETE FROM cache_entry_tag WHERE key = ?", (key,))
+            db.executemany("INSERT INTO cache_entry_tag (key, tag, version) VALUES (?, ?, ?)",
+                           [(key, tag, version) for tag, version in tag_versions.items()])
+            self._evict(db, now)
+
+    def _evict(self, db, now):
+        count, size = db.execute("SELECT count(*), total(size) FROM cache_entry").fetchone()
+        if count <= self.max_entries and size <= self.max_bytes:
+            return
+        db.execute("DELETE FROM cache_entry WHERE expires_at <= ?", (now,))
+        count, size = db.execute("SELECT count(*), total(size) FROM cache_entry").fetchone()
+        # Least recently used first, down to 90% of each bound so eviction isn't needed on every write
+        excess_count = count - int(self.max_entries * 0.9)
+        excess_bytes = size - self.max_bytes * 0.9
+        victims = []
+        for key, entry_size in db.execute("SELECT key, size FROM cache_entry ORDER BY accessed_at"):
+            if excess_count <= 0 and excess_bytes <= 0:
+                break
+            victims.append((key,))
+            excess_count -= 1
+            excess_bytes -= entry_size
+        db.executemany("DELETE FROM cache_entry WHERE key = ?", victims)
+
+    def delete(self, key):
+        self._db().execute("DELETE FROM cache_entry WHERE key = ?", (key,))
+
+    def tag_versions(self, tags):
+        tags = list(tags)
+        if not tags:
+            return {}
+        found = dict(self._db().execute(
+            f"SELECT tag, version FROM cache_tag WHERE tag IN ({', '.join('?' * len(tags))})", tags))
+        return {tag: found.get(tag, 0) for tag in tags}
+
+    def bump(self, tags):
+        self._db().executemany("INSERT INTO cache_tag (tag, version) VALUES (?, 1) "
+                               "ON CONFLICT (tag) DO UPDATE SET version = version + 1", [(tag,) for tag in tags])
+
+    def try_lock(self, name, token, lease):
+        db = self._db()
+        now = time.time()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DELETE FROM cache_lock WHERE name = ? AND expires_at <= ?", (name, now))
+            inserted = db.execute("INSERT OR IGNORE INTO cache_lock (name, token, expires_at) VALUES (?, ?, ?)",
+                                  (name, token, now + lease)).rowcount
+        return inserted == 1
+
+    def unlock(self, name, token):
+        self._db().execute("DELETE FROM cache_lock WHERE name = ? AND token = ?", (name, token))
+
+    def clear(self):
+        db = self._db()
+        with db:
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DELETE FROM cache_entry")
+            db.execute("DELETE FROM cache_lock")
+
+
+class MemoryBackend(CacheBackend):
+    def __init__(self, max_entries=2000, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (data, expires_at, tag_versions), least recently used first
+        self._size = 0
+        self._tags = {}
+        self._locks = {}
+        self._mutex = threading.Lock()
+
+    def load(self, key):
+        with self._mutex:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            data, expires_at, tag_versions = entry
+            stale = any(self._tags.get(tag, 0) != version for tag, version in tag_versions.items())
+            return data, expires_at, stale
+
+    def store(self, key, data, expires_at, tag_versions):
+        with self._mutex:
+            self._drop(key)
+            self._entries[key] = (data, expires_at, dict(tag_versions))
+            self._size += len(data)
+            while self._entries and (len(self._entries) > self.max_entries or self._size > self.max_bytes):
+                self._drop(next(iter(self._entries)))
+
+    def _drop(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._size -= len(entry[0])
+
+    def delete(self, key):
+        with self._mutex:
+            self._drop(key)
+
+    def tag_versions(self, tags):
+        with self._mutex:
+            return {tag: self._tags.get(tag, 0) for tag in tags}
+
+    def bump(self, tags):
+        with self._mutex:
+            for tag in tags:
+                self._tags[tag] = self._tags.get(tag, 0) + 1
+
+    def try_lock(self, name, token, lease):
+        with self._mutex:
+            holder = self._locks.get(name)
+            if holder is not None and holder[1] > time.time():
+                return False
+            self._locks[name] = (token, time.time() + lease)
+            return True
+
+    def unlock(self, name, token):
+        with self._mutex:
+            if self._locks.get(name, (None,))[0] == token:
+                del self._locks[name]
+
+    def clear(self):
+        with self._mutex:
+            self._entries.clear()
+            self._size = 0
+            self._locks.clear()
+
+
+def make_backend(config):
+    name = config.get('CACHE_BACKEND', 'sqlite')
+    limits = {'max_entries': config.get('CACHE_MAX_ENTRIES', 2000), 'max_bytes': config.get('CACHE_MAX_BYTES', 64 << 20)}
+    if name == 'sqlite':
+        return SQLiteBackend(Path(config['CACHE_DIR']) / 'shared_cache.db', **limits)
+    if name == 'memory':
+        return MemoryBackend(**limits)
+    raise ValueError(f"Unknown CACHE_BACKEND {name!r} (use 'sqlite' or 'memory')")
+
+
+class SharedCache:
+    """
+    Front end over a CacheBackend. A failing backend never fails the caller:
+    reads become misses and writes are skipped (with a warning).
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryBackend()
+        self.default_ttl = DEFAULT_TTL
+        self.lock_timeout = 15
+        self.hits = self.misses = 0
+
+    def configure(self, config):
+        self.backend = make_backend(config)
+        self.default_ttl = config.get('CACHE_DEFAULT_TTL', DEFAULT_TTL)
+        self.lock_timeout = config.get('CACHE_LOCK_TIMEOUT', 15)
+
+    def _safely(self, action, fallback=None):
+        try:
+            return action()
+        except (sqlite3.Error, OSError, pickle.PickleError) as e:
+            print(f"⚠️ Shared cache unavailable: {e}")
+            return fallback
+
+    def get(self, key, default=None):
+        entry = self._safely(lambda: self.backend.load(key))
+        if entry is None or entry[2] or entry[1] <= time.time():
+            self.misses += 1
+            return default
+        try:
+            value = pickle.loads(entry[0])
+        except Exception:
+            return default
+        self.hits += 1
+        return value
+
+    def set(self, key, value, ttl=None, tags=(), tag_versions=None):
+        """Stores `value`; `tag_versions` (from tag_versions()) should be read before computing it."""
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        versions = tag_versions if tag_versions is not None else self.tag_versions(tags)
+        self._safely(lambda: self.backend.store(key, data, time.time() + (ttl or self.default_ttl), versions))
+
+    def delete(self, key):
+        self._safely(lambda: self.backend.delete(key))
+
+    def tag_versions(self, tags):
+        return self._safely(lambda: self.backend.tag_versions(tags), {tag: 0 for tag in tags})
+
+    def invalidate(self, tags):
+        """Marks every entry tagged with any of `tags` stale (in every worker)."""
+        if tags:
+            self._safely(lambda: self.backend.bump(sorted(tags)))
+
+    def clear(self):
+        self._safely(self.backend.clear)
+
+    @contextmanager
+    def lock(self, name, timeout=None):
+        """
+        Holds the named lock across workers, waiting up to `timeout` seconds.
+        Yields True when held; False if the wait timed out (the caller goes on
+        unprotected rather than failing).
+        """
+        timeout = self.lock_timeout if timeout is None else timeout
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + timeout
+        held = False
+        # The lease outlives the wait, so a worker that dies mid-compute only blocks others until it expires
+        while not held:
+            held = self._safely(lambda: self.backend.try_lock(name, token, timeout * 2), True)
+            if held or time.monotonic() >= deadline:
+                break
+            time.sleep(0.05)
+        try:
+            yield held
+        finally:
+            if held:
+                self._safely(lambda: self.backend.unlock(name, token))
+
+    def get_or_set(self, key, compute, ttl=None, tags=()):
+        """The cached value, or compute() once across all workers and cache it."""
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+        with self.lock(f"compute:{key}"):
+            # Another worker may have filled it while we waited
+            value = self.get(key, MISSING)
+            if value is not MISSING:
+                return value
+            versions = self.tag_versions(tags)
+            value = compute()
+            self.set(key, value, ttl, tag_versions=versions)
+        return value
+
+
+shared_cache = SharedCache()
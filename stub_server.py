@@ -0,0 +1,238 @@
+"""
+Offline stand-in for Gemini, Open-Meteo (forecast + archive) and OpenWeatherMap.
+
+Replays the recorded responses in stubs/ with configurable latency and
+error injection, so the app can be load-tested without network or API keys.
+
+Usage:
+    python stub_server.py --port 8099 --latency-ms 300 --error-rate 0.02
+    python stub_server.py --print-env      # env vars that point the app here
+"""
+import argparse
+import datetime
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+from urllib.parse import urlparse, parse_qs
+
+STUB_DIR = Path(__file__).resolve().parent / 'stubs'
+
+
+class StubSettings:
+    def __init__(self, latency_ms=0, jitter_ms=0, error_rate=0.0, chunk_delay_ms=50, seed=42, record_dir=STUB_DIR):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.chunk_delay_ms = chunk_delay_ms
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.seed = seed
+
+        with open(Path(record_dir) / 'gemini.json', 'r') as f:
+            self.gemini = json.load(f)
+        with open(Path(record_dir) / 'open_meteo_forecast.json', 'r') as f:
+            self.forecast = json.load(f)
+        with open(Path(record_dir) / 'openweathermap.json', 'r') as f:
+            self.current_weather = json.load(f)
+
+    def roll(self):
+        """Returns (delay_seconds, should_fail) for one request."""
+        with self.rng_lock:
+            jitter = self.rng.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0
+            fail = self.rng.random() < self.error_rate
+        return max(0, self.latency_ms + jitter) / 1000, fail
+
+
+def env_for(host, port):
+    """Environment variables that point the app at a stub server."""
+    base = f"http://{host}:{port}"
+    return {
+        'GEMINI_API_BASE': f"{base}/v1beta",
+        'GEMINI_API_KEY': 'stub-key',
+        'OPEN_METEO_FORECAST_URL': f"{base}/v1/forecast",
+        'OPEN_METEO_ARCHIVE_URL': f"{base}/v1/archive",
+        'OPENWEATHERMAP_URL': f"{base}/data/2.5/weather",
+        'OPENWEATHERMAP_API_KEY': 'stub-key'
+    }
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    settings = None  # set by make_server
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass  # keep benchmark output clean
+
+    # --- plumbing ---
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _inject(self):
+        """Applies latency; returns True if an error response was sent instead."""
+        delay, fail = self.settings.roll()
+        if delay:
+            time.sleep(delay)
+        if fail:
+            self._send_json({"error": {"code": 503, "message": "Stub injected error", "status": "UNAVAILABLE"}}, status=503)
+            return True
+        return False
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        if self._inject():
+            return
+
+        if url.path == '/v1/forecast':
+            self._send_json(self._per_location(query, self._forecast))
+        elif url.path == '/v1/archive':
+            self._send_json(self._per_location(query, self._archive))
+        elif url.path == '/data/2.5/weather':
+            self._send_json(self.settings.current_weather)
+        else:
+            self._send_json({"error": True, "reason": f"Unknown stub path {url.path}"}, status=404)
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        length = int(self.headers.get('Content-Length', 0))
+        payload = json.loads(self.rfile.read(length) or b'{}')
+        if self._inject():
+            return
+
+        if url.path.endswith(':generateContent'):
+            self._send_json(self._gemini_response(self._gemini_text(payload)))
+        elif url.path.endswith(':streamGenerateContent'):
+            self._stream_gemini(self._gemini_text(payload))
+        else:
+            self._send_json({"error": {"code": 404, "message": f"Unknown stub path {url.path}"}}, status=404)
+
+    # --- Open-Meteo ---
+    def _per_location(self, query, build):
+        """Like Open-Meteo: comma-separated coordinates get a list with one result per location."""
+        latitudes = query.get('latitude', [''])[0].split(',')
+        longitudes = query.get('longitude', [''])[0].split(',')
+        if len(latitudes) < 2:
+            return build(query)
+        return [build(dict(query, latitude=[lat], longitude=[lon])) for lat, lon in zip(latitudes, longitudes)]
+
+    def _forecast(self, query):
+        data = json.loads(json.dumps(self.settings.forecast))
+        # Re-date the recording so "today" is always the first day
+        start = datetime.date.today()
+        if 'start_date' in query:
+            start = datetime.date.fromisoformat(query['start_date'][0])
+        days = len(data['daily']['time'])
+        if 'start_date' in query and 'end_date' in query:
+            days = (datetime.date.fromisoformat(query['end_date'][0]) - start).days + 1
+            for key in ('weather_code', 'temperature_2m_max', 'temperature_2m_min', 'precipitation_sum'):
+                if key not in data['daily']:
+                    continue
+                recorded = data['daily'][key]
+                data['daily'][key] = [recorded[i % len(recorded)] for i in range(days)]
+        data['daily']['time'] = [(start + datetime.timedelta(days=i)).isoformat() for i in range(days)]
+        return data
+
+    def _archive(self, query):
+        start = datetime.date.fromisoformat(query['start_date'][0])
+        end = datetime.date.fromisoformat(query['end_date'][0])
+        daily = {'time': [], 'weather_code': [], 'temperature_2m_max': [], 'temperature_2m_min': [], 'precipitation_sum': []}
+        day = start
+        while day <= end:
+            # Seeded per date so the same range always returns the same series
+            rng = random.Random(f"{self.settings.seed}-{day.isoformat()}")
+            monsoon = day.month in (6, 7, 8, 9)
+            daily['time'].append(day.isoformat())
+            daily['weather_code'].append(rng.choice([61, 63, 80, 3]) if monsoon else rng.choice([0, 1, 2, 3]))
+            daily['temperature_2m_max'].append(round(rng.uniform(29, 35) if monsoon else rng.uniform(22, 30), 1))
+            daily['temperature_2m_min'].append(round(daily['temperature_2m_max'][-1] - (5 if monsoon else 10), 1))
+            daily['precipitation_sum'].append(round(rng.uniform(2, 40), 1) if monsoon else round(rng.choice([0, 0, 0, 1.5]), 1))
+            day += datetime.timedelta(days=1)
+        return {
+            'latitude': float(query.get('latitude', ['26.1445'])[0]),
+            'longitude': float(query.get('longitude', ['91.7362'])[0]),
+            'timezone': 'Asia/Kolkata',
+            'daily_units': self.settings.forecast['daily_units'],
+            'daily': daily
+        }
+
+    # --- Gemini ---
+    def _gemini_text(self, payload):
+        prompt = " ".join(
+            part.get('text', '')
+            for content in payload.get('contents', [])
+            for part in content.get('parts', [])
+        )
+        for recorded in self.settings.gemini['responses']:
+            if recorded['match'] in prompt:
+                return recorded['text']
+        return ""
+
+    def _gemini_response(self, text):
+        return {
+            "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP", "index": 0}],
+            "usageMetadata": self.settings.gemini['usageMetadata']
+        }
+
+    def _stream_gemini(self, text):
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Connection', 'close')
+        self.end_headers()
+        self.close_connection = True
+
+        words = text.split(' ')
+        chunks = [" ".join(words[i:i + 8]) + " " for i in range(0, len(words), 8)]
+        for chunk in chunks:
+            time.sleep(self.settings.chunk_delay_ms / 1000)
+            event = self._gemini_response(chunk)
+            self.wfile.write(f"data: {json.dumps(event)}\r\n\r\n".encode('utf-8'))
+            self.wfile.flush()
+
+
+def make_server(host='127.0.0.1', port=8099, **settings):
+    """Builds (but does not start) a stub server; port 0 picks a free port."""
+    handler = type('ConfiguredStubHandler', (StubHandler,), {'settings': StubSettings(**settings)})
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def start_stub_server(host='127.0.0.1', port=0, **settings):
+    """Starts a stub server on a daemon thread; returns (server, env_vars)."""
+    server = make_server(host, port, **settings)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server, env_for(host, server.server_address[1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Offline stand-in for the app's upstream APIs")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency-ms', type=float, default=0, help='Added delay per request')
+    parser.add_argument('--jitter-ms', type=float, default=0, help='Random +/- spread on the delay')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests answered with 503')
+    parser.add_argument('--chunk-delay-ms', type=float, default=50, help='Delay between streamed Gemini chunks')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--record-dir', default=str(STUB_DIR), help='Directory with recorded responses')
+    parser.add_argument('--print-env', action='store_true', help='Print env vars for the app and exit')
+    args = parser.parse_args()
+
+    if args.print_env:
+        for key, value in env_for(args.host, args.port).items():
+            print(f"{key}={value}")
+    else:
+        server = make_server(args.host, args.port, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms,
+                             error_rate=args.error_rate, chunk_delay_ms=args.chunk_delay_ms,
+                             seed=args.seed, record_dir=args.record_dir)
+        print(f"🧪 Stub upstreams on http://{args.host}:{args.port} (latency {args.latency_ms}ms, errors {args.error_rate:.0%})")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            server.shutdown()
@@ -0,0 +1,205 @@
+"""
+Delta sync for offline clients.
+
+Every synced table carries an indexed `sync_seq`; deletes leave a row in
+the tombstone table. Writes leave it NULL and the commit stamps them with
+the next number from a one-row sequence table (see stamp_changes). That
+row stays locked until the commit lands, so numbers become visible in
+commit order: once a reader sees the sequence at N, every change up to N
+is committed and nothing can later appear below it.
+
+A sync pass reads everything in the window (since, until] of sequence
+numbers, one stream at a time (tombstones first, then each table), in
+keyset order on (sync_seq, id), so any page costs one index range scan
+per stream.
+
+The cursor is opaque to the client:
+
+    GET /api/sync                      -> first full sync
+    GET /api/sync?cursor=<last cursor> -> the next page, or changes since the last sync
+
+Writes go the other way as a batch of operations, each with a client key
+so a retried upload is never applied twice (see app.apply_sync_change).
+"""
+import base64
+import datetime
+import gzip
+import json
+
+from sqlalchemy import Boolean, Date, DateTime, Float, Integer, String, insert, select, tuple_, update
+
+CURSOR_VERSION = 2
+# Server bookkeeping, never sent to clients
+SEQ_COLUMN = 'sync_seq'
+
+
+def encode_cursor(since, until, stream=0, after=None):
+    state = {'v': CURSOR_VERSION, 'since': since, 'until': until, 'stream': stream,
+             'after': list(after) if after else None}
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Cursor -> (since, until, stream, after). Raises ValueError for anything unreadable."""
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if state.get('v') != CURSOR_VERSION:
+            raise ValueError("Unknown cursor version; start a full sync")
+        after = state.get('after')
+        return (_seq(state.get('since')), _seq(state.get('until')), int(state.get('stream', 0)),
+                (int(after[0]), int(after[1])) if after else None)
+    except (TypeError, KeyError, IndexError, AttributeError, json.JSONDecodeError, UnicodeDecodeError,
+            base64.binascii.Error) as e:
+        raise ValueError(f"Bad sync cursor: {e}")
+
+
+def _seq(value):
+    return int(value) if value is not None else None
+
+
+def current_seq(session, sequence):
+    """The last committed sequence number (0 before the first synced write)."""
+    return session.execute(select(sequence.c.seq)).scalar() or 0
+
+
+def stamp_changes(connection, sequence, tables):
+    """
+    Stamps every row of `tables` written in this transaction (sync_seq still
+    NULL) with the next sequence number, which it returns. Run it last
+    before commit: the sequence row stays locked until then.
+    """
+    seq = connection.execute(update(sequence).values(seq=sequence.c.seq + 1).returning(sequence.c.seq)).scalar()
+    if seq is None:
+        seq = 1
+        connection.execute(insert(sequence).values(id=1, seq=seq))
+    for table in tables:
+        values = {SEQ_COLUMN: seq}
+        if 'updated_at' in table.c:
+            values['updated_at'] = table.c.updated_at  # not a new write, so keep its own stamp
+        connection.execute(update(table).where(table.c[SEQ_COLUMN].is_(None)).values(values))
+    return seq
+
+
+def _iso(value):
+    return value.isoformat() if value is not None else None
+
+
+def parse_timestamp(value):
+    """
+    A client ISO timestamp -> naive local datetime, like the server's own
+    stamps. Offsets ('Z', '+05:30') are converted. Raises ValueError.
+    """
+    if not isinstance(value, str):
+        raise ValueError(f"Expected an ISO timestamp, got {value!r}")
+    parsed = datetime.datetime.fromisoformat(value)
+    return parsed.astimezone().replace(tzinfo=None) if parsed.tzinfo else parsed
+
+
+def serialize(mapping):
+    """Row mapping -> JSON-ready dict (dates as ISO strings)."""
+    return {key: value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else value
+            for key, value in mapping.items() if key != SEQ_COLUMN}
+
+
+def changes_page(session, sources, tombstones, since, until, stream=0, after=None, limit=500):
+    """
+    Up to `limit` changes with sequence numbers in (since, until] as dicts,
+    starting at `stream`/`after`. Streams are the tombstone table, then
+    `sources` in order ({kind: table}). Returns (changes, next_position);
+    next_position is (stream, after) to continue from, or None when the
+    window is exhausted.
+    """
+    streams = [None] + list(sources)
+    changes = []
+    while stream < len(streams):
+        kind = streams[stream]
+        table = tombstones if kind is None else sources[kind]
+        stamp = table.c[SEQ_COLUMN]
+        query = select(table).where(stamp <= until).order_by(stamp, table.c.id).limit(limit - len(changes) + 1)
+        if since is not None:
+            query = query.where(stamp > since)
+        if after is not None:
+            query = query.where(tuple_(stamp, table.c.id) > after)
+        room = limit - len(changes)
+        rows = session.execute(query).mappings().all()
+        for row in rows[:room]:
+            if kind is None:
+                changes.append({'kind': row['kind'], 'op': 'delete', 'id': row['row_id'],
+                                'at': row['deleted_at'].isoformat()})
+            else:
+                changes.append({'kind': kind, 'op': 'upsert', 'id': row['id'], 'data': serialize(row)})
+            after = (row[SEQ_COLUMN], row['id'])
+        if len(rows) > room:
+            return changes, (stream, after)
+        stream, after = stream + 1, None
+    return changes, None
+
+
+def ndjson(lines, compress=False):
+    """One JSON document per line; gzipped when the client accepts it."""
+    body = ''.join(json.dumps(line, separators=(',', ':'), ensure_ascii=False) + '\n' for line in lines).encode()
+    return gzip.compress(body, 6) if compress else body
+
+
+def read_json_body(request):
+    """The request's JSON body, gunzipped first if sent with Content-Encoding: gzip."""
+    data = request.get_data()
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        data = gzip.decompress(data)
+    return json.loads(data or b'null')
+
+
+def coerce_value(column, value):
+    """A JSON value -> the column's Python type. Raises ValueError when it doesn't fit."""
+    if value is None:
+        if not column.nullable:
+            raise ValueError(f"{column.name} is required")
+        return None
+    kind = column.type
+    if isinstance(kind, DateTime):
+        return parse_timestamp(value)
+    if isinstance(kind, Date):
+        return datetime.date.fromisoformat(value[:10])
+    if isinstance(kind, Boolean):
+        if isinstance(value, str):
+            return value.lower() in ('1', 'true', 'yes', 'on')
+        return bool(value)
+    if isinstance(kind, Integer):
+        if isinstance(value, bool) or (isinstance(value, float) and not value.is_integer()):
+            raise ValueError(f"{column.name} must be a whole number")
+        return int(value)
+    if isinstance(kind, Float):
+        if isinstance(value, bool):
+            raise ValueError(f"{column.name} must be a number")
+        return float(value)
+    if isinstance(kind, String):
+        value = str(value)
+        if kind.length and len(value) > kind.length:
+            raise ValueError(f"{column.name} is longer than {kind.length} characters")
+        return value
+    return value
+
+
+def column_values(table, data, exclude=(), creating=False):
+    """
+    Client fields -> {column: value} for `table`, checked against the schema.
+    Unknown or read-only fields and missing required fields raise ValueError.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("data must be an object")
+    writable = {c.name: c for c in table.columns if not c.primary_key and c.name not in exclude}
+    unknown = set(data) - set(writable)
+    if unknown:
+        raise ValueError(f"Unknown or read-only fields: {', '.join(sorted(unknown))}")
+    values = {}
+    for name, value in data.items():
+        try:
+            values[name] = coerce_value(writable[name], value)
+        except (TypeError, AttributeError, ValueError) as e:
+            raise ValueError(str(e) if str(e).startswith(name) else f"{name}: {e}")
+    if creating:
+        missing = [c.name for c in writable.values()
+                   if not c.nullable and c.default is None and c.name not in values]
+        if missing:
+            raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    return values
@@ -0,0 +1,235 @@
+"""
+Weather time-series analytics over WeatherLog.
+
+The daily log is held in memory as typed arrays (array('d'), one slot per
+calendar day from the first log to the last, NaN where a day is missing),
+so a multi-year series costs a few KB instead of thousands of ORM objects.
+It is loaded once per process, then only rows from the last loaded day
+onward are read again. Rolling windows and growing degree days come from
+prefix sums, so each answer is O(1) once the sums are built.
+
+    cache = WeatherSeriesCache(WeatherLog.__table__)   # optionally with a WHERE clause (one location)
+    series = cache.get(db.session, stamp)   # stamp changes on every WeatherLog write
+    series.rolling_rain(7), series.gdd_between(sown, today, base=10)
+"""
+import datetime
+import math
+import threading
+from array import array
+from itertools import accumulate
+
+from sqlalchemy import func, select
+
+NaN = float('nan')
+HEAT_STRESS_C = 35.0
+# Assumed day/night spread when a log has no min temperature (older rows)
+DEFAULT_DIURNAL_RANGE = 8.0
+# Base temperatures for growing degree days (°C); anything else uses 10
+CROP_BASE_TEMPS = {'rice': 10.0, 'maize': 10.0, 'tomato': 10.0, 'brinjal': 10.0, 'chilli': 10.0,
+                   'mustard': 5.0, 'wheat': 5.0, 'potato': 7.0, 'cabbage': 5.0, 'turmeric': 12.0,
+                   'ginger': 12.0, 'banana': 14.0}
+DEFAULT_BASE_TEMP = 10.0
+GDD_CAP_C = 30.0  # heat above this adds no extra development
+
+
+def base_temp_for(crop_name):
+    words = (crop_name or '').lower().split()
+    return CROP_BASE_TEMPS.get(words[0] if words else '', DEFAULT_BASE_TEMP)
+
+
+def _clean(value):
+    return None if value is None or math.isnan(value) else round(value, 2)
+
+
+class WeatherSeries:
+    """Dense daily arrays starting at `start` (a date ordinal)."""
+
+    def __init__(self):
+        self.start = None
+        self.max_temp = array('d')
+        self.min_temp = array('d')
+        self.rainfall = array('d')
+        self.present = bytearray()  # 1 where the day has a row
+        self.logged = 0
+        self._derived = {}
+
+    def __len__(self):
+        return len(self.max_temp)
+
+    @property
+    def first_date(self):
+        return datetime.date.fromordinal(self.start) if self.start is not None else None
+
+    @property
+    def last_date(self):
+        return datetime.date.fromordinal(self.start + len(self) - 1) if len(self) else None
+
+    def index(self, day):
+        """Array position of `day`, clamped to the series."""
+        return min(max(day.toordinal() - self.start, 0), len(self))
+
+    def put(self, day, max_temp, min_temp, rainfall):
+        """Stores one day at or after the current start, growing the arrays with gaps as needed."""
+        if self.start is None:
+            self.start = day.toordinal()
+        i = day.toordinal() - self.start
+        if i < 0:
+            raise ValueError("put() only moves forward; reload for earlier days")
+        if i >= len(self):
+            gap = i + 1 - len(self)
+            for column in (self.max_temp, self.min_temp, self.rainfall):
+                column.extend([NaN] * gap)
+            self.present.extend(bytes(gap))
+        if not self.present[i]:
+            self.present[i] = 1
+            self.logged += 1
+        self.max_temp[i] = NaN if max_temp is None else max_temp
+        self.min_temp[i] = NaN if min_temp is None else min_temp
+        self.rainfall[i] = NaN if rainfall is None else rainfall
+        self._derived.clear()
+
+    # --- prefix sums (built lazily, dropped on every write) ---
+    def _prefix(self, key, values):
+        if key not in self._derived:
+            self._derived[key] = array('d', accumulate(values, initial=0.0))
+        return self._derived[key]
+
+    def _rain_prefix(self):
+        return self._prefix('rain', (0.0 if math.isnan(r) else r for r in self.rainfall))
+
+    def _gdd_prefix(self, base):
+        def daily(high, low):
+            if math.isnan(high):
+                return 0.0
+            low = high - DEFAULT_DIURNAL_RANGE if math.isnan(low) else low
+            mean = (min(high, GDD_CAP_C) + max(low, base)) / 2
+            return max(mean - base, 0.0)
+        return self._prefix(('gdd', base), map(daily, self.max_temp, self.min_temp))
+
+    def rolling_rain(self, window):
+        """Rain over the `window` days ending on each day (missing days count as dry)."""
+        key = ('rolling', window)
+        if key not in self._derived:
+            prefix = self._rain_prefix()
+            self._derived[key] = array('d', (prefix[i + 1] - prefix[max(0, i + 1 - window)] for i in range(len(self))))
+        return self._derived[key]
+
+    def rain_between(self, start, end):
+        prefix = self._rain_prefix()
+        return prefix[self.index(end + datetime.timedelta(days=1))] - prefix[self.index(start)]
+
+    def gdd_between(self, start, end, base=DEFAULT_BASE_TEMP):
+        """Growing degree days from `start` through `end` (inclusive)."""
+        if not len(self):
+            return 0.0
+        prefix = self._gdd_prefix(base)
+        return prefix[self.index(end + datetime.timedelta(days=1))] - prefix[self.index(start)]
+
+    def heat_days(self, start, end, threshold=HEAT_STRESS_C):
+        lo, hi = self.index(start), self.index(end + datetime.timedelta(days=1))
+        return sum(1 for t in self.max_temp[lo:hi] if t >= threshold)
+
+    def climatology(self, threshold=HEAT_STRESS_C):
+        """Per calendar month (averaged over years) and per year: mean max temp, rain, heat days."""
+        key = ('climatology', threshold)
+        if key in self._derived:
+            return self._derived[key]
+        months = {}  # (year, month) -> [temp_sum, temp_days, rain, heat_days]
+        day = self.first_date
+        for i in range(len(self)):
+            bucket = months.setdefault((day.year, day.month), [0.0, 0, 0.0, 0])
+            high, rain = self.max_temp[i], self.rainfall[i]
+            if not math.isnan(high):
+                bucket[0] += high
+                bucket[1] += 1
+                bucket[3] += high >= threshold
+            if not math.isnan(rain):
+                bucket[2] += rain
+            day += datetime.timedelta(days=1)
+
+        monthly, yearly = [], {}
+        for month in range(1, 13):
+            seen = [v for (y, m), v in months.items() if m == month and v[1]]
+            monthly.append({
+                'month': month,
+                'years': len(seen),
+                'mean_max_temp': _clean(sum(v[0] for v in seen) / sum(v[1] for v in seen)) if seen else None,
+                'mean_rainfall': _clean(sum(v[2] for v in seen) / len(seen)) if seen else None,
+                'mean_heat_days': _clean(sum(v[3] for v in seen) / len(seen)) if seen else None,
+            })
+        for (year, _), v in sorted(months.items()):
+            totals = yearly.setdefault(year, [0.0, 0, 0.0, 0])
+            for n in range(4):
+                totals[n] += v[n]
+        result = {
+            'monthly': monthly,
+            'yearly': [{'year': year, 'days': v[1], 'mean_max_temp': _clean(v[0] / v[1]) if v[1] else None,
+                        'rainfall': _clean(v[2]), 'heat_days': v[3]} for year, v in yearly.items()],
+        }
+        self._derived[key] = result
+        return result
+
+    def downsample(self, start, end, max_points=365, window=7):
+        """
+        The [start, end] range in at most `max_points` buckets of whole days:
+        mean/max temperature, total rain and the rolling rain at bucket end.
+        """
+        lo, hi = self.index(start), self.index(end + datetime.timedelta(days=1))
+        days = max(hi - lo, 0)
+        step = max(math.ceil(days / max_points), 1) if max_points else 1
+        rolling = self.rolling_rain(window) if days else array('d')
+        out = {'dates': [], 'max_temp': [], 'max_temp_peak': [], 'min_temp': [], 'rainfall': [],
+               'rain_rolling': []}
+        for b in range(lo, hi, step):
+            e = min(b + step, hi)
+            highs = [t for t in self.max_temp[b:e] if not math.isnan(t)]
+            lows = [t for t in self.min_temp[b:e] if not math.isnan(t)]
+            rains = [r for r in self.rainfall[b:e] if not math.isnan(r)]
+            out['dates'].append(datetime.date.fromordinal(self.start + b).isoformat())
+            out['max_temp'].append(_clean(sum(highs) / len(highs)) if highs else None)
+            out['max_temp_peak'].append(max(highs) if highs else None)
+            out['min_temp'].append(_clean(sum(lows) / len(lows)) if lows else None)
+            out['rainfall'].append(_clean(sum(rains)) if rains else None)
+            out['rain_rolling'].append(_clean(rolling[e - 1]))
+        out['bucket_days'] = step
+        return out
+
+
+class WeatherSeriesCache:
+    """One WeatherSeries per process (for the rows matching `where`), refreshed when the caller's stamp changes."""
+
+    def __init__(self, table, where=None):
+        self.table = table
+        self.where = where
+        self.series = None
+        self.stamp = None
+        self._lock = threading.Lock()
+
+    def _columns(self):
+        c = self.table.c
+        query = select(c.date, c.max_temp, c.min_temp, c.rainfall).order_by(c.date)
+        return query if self.where is None else query.where(self.where)
+
+    def _load(self, session):
+        series = WeatherSeries()
+        for row in session.execute(self._columns()):
+            series.put(row.date, row.max_temp, row.min_temp, row.rainfall)
+        return series
+
+    def get(self, session, stamp):
+        with self._lock:
+            if self.series is not None and stamp == self.stamp:
+                return self.series
+            if self.series is None or not len(self.series):
+                self.series = self._load(session)
+            else:
+                # Re-read the last loaded day (today's row can be updated) and everything after it
+                for row in session.execute(self._columns().where(self.table.c.date >= self.series.last_date)):
+                    self.series.put(row.date, row.max_temp, row.min_temp, row.rainfall)
+                # Rows inserted before the last day (history backfill) or deleted: start over
+                count = select(func.count()).select_from(self.table)
+                total = session.execute(count if self.where is None else count.where(self.where)).scalar()
+                if total != self.series.logged:
+                    self.series = self._load(session)
+            self.stamp = stamp
+            return self.series
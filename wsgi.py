@@ -1,9 +1,11 @@
-import os
-from app import app, db
+from app import create_app
+from knowledge import knowledge
 
-# Ensure tables are created in production (Render)
-with app.app_context():
-    db.create_all()
+# Schema changes are a deploy step (`flask --app wsgi init-db`), not worker boot
+app = create_app()
+
+# Read reference data here so a preloaded gunicorn master shares it with every worker
+knowledge.warm()
 
 if __name__ == "__main__":
     app.run()